@@ -0,0 +1,65 @@
+"""
+Scrape latency against count of series in one metric family.
+
+Usage:
+
+    $ python -m benchmarks.collect_latency redis://localhost:6380
+
+Redis database will be flushed.
+"""
+import asyncio
+import sys
+import time
+
+from redis import asyncio as aioredis
+
+import prometheus_aioredis_client as prom
+
+SERIES_COUNTS = (10, 100, 1000, 10000, 50000)
+REPEATS = 5
+
+
+async def fill(redis, counter, series_count):
+    group_key = counter.get_metric_group_key()
+    async with redis.pipeline(transaction=False) as pipe:
+        for i in range(series_count):
+            metric_key = counter.get_metric_key({"name": str(i)})
+            pipe.sadd(group_key, metric_key)
+            pipe.set(metric_key, i)
+        await pipe.execute()
+
+
+async def measure(redis, series_count):
+    await redis.flushdb()
+    registry = prom.Registry(redis=redis, task_manager=prom.TaskManager())
+    counter = prom.Counter(
+        "bench_counter", "Benchmark counter", ["name"],
+        registry=registry
+    )
+    await fill(redis, counter, series_count)
+
+    timings = []
+    for _ in range(REPEATS):
+        start = time.perf_counter()
+        await registry.output()
+        timings.append(time.perf_counter() - start)
+    await registry.cleanup_and_close()
+    return min(timings), sum(timings) / len(timings)
+
+
+async def main(redis_uri):
+    redis = await aioredis.from_url(redis_uri)
+    print("{:>10} {:>12} {:>12}".format("series", "min, ms", "avg, ms"))
+    for series_count in SERIES_COUNTS:
+        best, avg = await measure(redis, series_count)
+        print("{:>10} {:>12.2f} {:>12.2f}".format(
+            series_count, best * 1000, avg * 1000
+        ))
+    await redis.flushdb()
+    await redis.close()
+
+
+if __name__ == '__main__':
+    asyncio.run(main(
+        sys.argv[1] if len(sys.argv) > 1 else 'redis://localhost:6380'
+    ))
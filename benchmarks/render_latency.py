@@ -0,0 +1,62 @@
+"""
+Collect and rendering time of Registry.output for big metric family.
+Values are stored by MemoryBackend, so Redis is not used and time
+includes Metric.collect with parsing of labels.
+First output parse all labels, next outputs reuse parsed labels.
+
+Usage:
+
+    $ python -m benchmarks.render_latency
+"""
+import asyncio
+import time
+
+import prometheus_aioredis_client as prom
+from prometheus_aioredis_client.layouts import INCRBY
+
+SERIES_COUNTS = (1000, 10000, 100000)
+REPEATS = 5
+
+
+async def fill(counter, series_count):
+    await counter.registry.backend.apply(counter, [
+        (INCRBY, counter.get_metric_key({
+            "method": "GET",
+            "url": "/api/v1/items/{}".format(i),
+        }), i)
+        for i in range(series_count)
+    ])
+
+
+async def measure(series_count):
+    registry = prom.Registry(
+        task_manager=prom.TaskManager(), backend=prom.MemoryBackend()
+    )
+    counter = prom.Counter(
+        "bench_counter", "Benchmark counter", ["method", "url"],
+        registry=registry
+    )
+    await fill(counter, series_count)
+
+    timings = []
+    for _ in range(REPEATS + 1):
+        start = time.perf_counter()
+        await registry.output()
+        timings.append(time.perf_counter() - start)
+    first, timings = timings[0], timings[1:]
+    return first, min(timings), sum(timings) / len(timings)
+
+
+async def main():
+    print("{:>10} {:>12} {:>12} {:>12}".format(
+        "series", "first, ms", "min, ms", "avg, ms"
+    ))
+    for series_count in SERIES_COUNTS:
+        first, best, avg = await measure(series_count)
+        print("{:>10} {:>12.2f} {:>12.2f} {:>12.2f}".format(
+            series_count, first * 1000, best * 1000, avg * 1000
+        ))
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,288 @@
+"""
+Benchmark suite of write throughput and scrape latency.
+
+Measure ops/sec of Counter.inc, Counter.a_inc, Summary.observe,
+Histogram.observe with different count of buckets and Gauge.set,
+then latency and peak memory of Registry.output for 1k, 10k
+and 100k series. Results are printed and written as JSON.
+
+Usage:
+
+    $ python -m benchmarks.suite --output results.json
+    $ python -m benchmarks.suite --redis-uri redis://localhost:6380
+    $ python -m benchmarks.suite --baseline results.json
+
+Without '--redis-uri' redis-server is started on free port and
+stopped after benchmarks. Redis database will be flushed.
+With '--baseline' exit code is 1 if results are worse than
+baseline results more than '--threshold'.
+"""
+import argparse
+import asyncio
+import contextlib
+import json
+import platform
+import socket
+import subprocess
+import sys
+import time
+import tracemalloc
+
+from redis import asyncio as aioredis
+from redis.exceptions import ConnectionError
+
+import prometheus_aioredis_client as prom
+
+WRITE_OPS = 20000
+HISTOGRAM_BUCKETS = (5, 20, 50)
+SERIES_COUNTS = (1000, 10000, 100000)
+REPEATS = 5
+REGRESSION_THRESHOLD = 0.2
+
+
+def free_port() -> int:
+    with contextlib.closing(socket.socket()) as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+@contextlib.asynccontextmanager
+async def redis_server(redis_uri: str=None):
+    """
+    Yield client of Redis. Start local redis-server if uri is not given.
+    """
+    process = None
+    if redis_uri is None:
+        port = free_port()
+        process = subprocess.Popen(
+            ['redis-server', '--port', str(port), '--save', '',
+             '--appendonly', 'no'],
+            stdout=subprocess.DEVNULL
+        )
+        redis_uri = 'redis://127.0.0.1:{}'.format(port)
+    redis = aioredis.from_url(redis_uri)
+    try:
+        for _ in range(100):
+            try:
+                await redis.ping()
+                break
+            except ConnectionError:
+                await asyncio.sleep(0.05)
+        await redis.flushdb()
+        yield redis
+    finally:
+        await redis.close()
+        if process is not None:
+            process.terminate()
+            process.wait()
+
+
+def make_registry(redis) -> prom.Registry:
+    return prom.Registry(redis=redis, task_manager=prom.TaskManager())
+
+
+async def measure_writes(redis, name: str, make_metric, write, ops: int,
+                         is_async: bool=False) -> dict:
+    """
+    Return ops/sec of 'write(metric, i)' calls. Time of fire-and-forget
+    calls include waiting of all tasks, so Redis round trips are counted.
+    """
+    await redis.flushdb()
+    registry = make_registry(redis)
+    metric = make_metric(registry)
+    # warm up caches and gauge index
+    if is_async:
+        await write(metric, 0)
+    else:
+        write(metric, 0)
+    await registry.task_manager.wait_tasks()
+
+    start = time.perf_counter()
+    if is_async:
+        for i in range(ops):
+            await write(metric, i)
+    else:
+        for i in range(ops):
+            write(metric, i)
+    await registry.task_manager.wait_tasks()
+    elapsed = time.perf_counter() - start
+    await registry.cleanup_and_close()
+    return {
+        'name': name,
+        'ops': ops,
+        'seconds': elapsed,
+        'ops_per_sec': ops / elapsed,
+    }
+
+
+def write_benchmarks():
+    labels = ["method", "code"]
+
+    def counter(registry):
+        return prom.Counter(
+            "bench_counter", "Benchmark", labels, registry=registry
+        )
+
+    def summary(registry):
+        return prom.Summary(
+            "bench_summary", "Benchmark", labels, registry=registry
+        )
+
+    def histogram(buckets):
+        def make(registry):
+            return prom.Histogram(
+                "bench_histogram", "Benchmark", labels,
+                buckets=[0.001 * 2 ** i for i in range(buckets)],
+                registry=registry
+            )
+        return make
+
+    def gauge(registry):
+        return prom.Gauge(
+            "bench_gauge", "Benchmark", labels, registry=registry
+        )
+
+    yield 'Counter.inc', counter, \
+        lambda m, i: m.labels("GET", "200").inc(), False
+    yield 'Counter.a_inc', counter, \
+        lambda m, i: m.labels("GET", "200").a_inc(), True
+    yield 'Summary.observe', summary, \
+        lambda m, i: m.labels("GET", "200").observe(0.01 * (i % 100)), False
+    for buckets in HISTOGRAM_BUCKETS:
+        yield 'Histogram.observe[buckets={}]'.format(buckets), \
+            histogram(buckets), \
+            lambda m, i: m.labels("GET", "200").observe(0.01 * (i % 100)), \
+            False
+    yield 'Gauge.set', gauge, \
+        lambda m, i: m.labels("GET", "200").set(i), False
+
+
+async def fill(redis, counter, series_count: int):
+    group_key = counter.get_metric_group_key()
+    async with redis.pipeline(transaction=False) as pipe:
+        for i in range(series_count):
+            metric_key = counter.get_metric_key({"name": str(i)})
+            pipe.sadd(group_key, metric_key)
+            pipe.set(metric_key, i)
+        await pipe.execute()
+
+
+async def measure_output(redis, series_count: int) -> dict:
+    """
+    Return latency of Registry.output and peak memory allocated by it.
+    Memory measured by separate run, because tracemalloc slow down it.
+    """
+    await redis.flushdb()
+    registry = make_registry(redis)
+    counter = prom.Counter(
+        "bench_counter", "Benchmark", ["name"], registry=registry
+    )
+    await fill(redis, counter, series_count)
+
+    timings = []
+    for _ in range(REPEATS):
+        start = time.perf_counter()
+        await registry.output()
+        timings.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    await registry.output()
+    _, peak_memory = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    await registry.cleanup_and_close()
+    return {
+        'series': series_count,
+        'min_ms': min(timings) * 1000,
+        'avg_ms': sum(timings) / len(timings) * 1000,
+        'peak_memory_bytes': peak_memory,
+    }
+
+
+async def main(redis_uri: str=None, output: str=None,
+               ops: int=WRITE_OPS, series_counts=SERIES_COUNTS) -> dict:
+    async with redis_server(redis_uri) as redis:
+        info = await redis.info('server')
+        results = {
+            'meta': {
+                'timestamp': time.time(),
+                'python': platform.python_version(),
+                'redis': info.get('redis_version'),
+            },
+            'writes': [],
+            'output': [],
+        }
+
+        print("{:<32} {:>14}".format("write", "ops/sec"))
+        for name, make_metric, write, is_async in write_benchmarks():
+            result = await measure_writes(
+                redis, name, make_metric, write, ops, is_async
+            )
+            results['writes'].append(result)
+            print("{:<32} {:>14.0f}".format(name, result['ops_per_sec']))
+
+        print("{:>10} {:>12} {:>12} {:>14}".format(
+            "series", "min, ms", "avg, ms", "peak mem, KiB"
+        ))
+        for series_count in series_counts:
+            result = await measure_output(redis, series_count)
+            results['output'].append(result)
+            print("{:>10} {:>12.2f} {:>12.2f} {:>14.0f}".format(
+                series_count, result['min_ms'], result['avg_ms'],
+                result['peak_memory_bytes'] / 1024
+            ))
+        await redis.flushdb()
+
+    if output is not None:
+        with open(output, 'w') as f:
+            json.dump(results, f, indent=2)
+    return results
+
+
+def regressions(results: dict, baseline: dict,
+                threshold: float=REGRESSION_THRESHOLD) -> list:
+    """
+    Return descriptions of results worse than baseline
+    by more than 'threshold' part.
+    """
+    found = []
+    base_writes = {r['name']: r for r in baseline['writes']}
+    for result in results['writes']:
+        base = base_writes.get(result['name'])
+        if base and result['ops_per_sec'] < base['ops_per_sec'] * (1 - threshold):
+            found.append("{}: {:.0f} ops/sec, baseline {:.0f}".format(
+                result['name'], result['ops_per_sec'], base['ops_per_sec']
+            ))
+    base_output = {r['series']: r for r in baseline['output']}
+    for result in results['output']:
+        base = base_output.get(result['series'])
+        if base and result['min_ms'] > base['min_ms'] * (1 + threshold):
+            found.append("output of {} series: {:.2f} ms, baseline {:.2f}".format(
+                result['series'], result['min_ms'], base['min_ms']
+            ))
+    return found
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--redis-uri', help="use running Redis")
+    parser.add_argument('--output', help="write results to JSON file")
+    parser.add_argument('--ops', type=int, default=WRITE_OPS,
+                        help="count of writes per benchmark")
+    parser.add_argument('--series', type=int, nargs='+',
+                        default=SERIES_COUNTS,
+                        help="counts of series for output benchmark")
+    parser.add_argument('--baseline', help="compare with JSON results")
+    parser.add_argument('--threshold', type=float,
+                        default=REGRESSION_THRESHOLD,
+                        help="allowed part of regression")
+    args = parser.parse_args()
+    results = asyncio.run(
+        main(args.redis_uri, args.output, args.ops, args.series)
+    )
+    if args.baseline is not None:
+        with open(args.baseline) as f:
+            found = regressions(results, json.load(f), args.threshold)
+        for regression in found:
+            print("Regression:", regression)
+        sys.exit(1 if found else 0)
@@ -3,6 +3,7 @@ from prometheus_aioredis_client import (
     Counter, Histogram, Summary, Gauge,
     REGISTRY
 )
+from prometheus_aioredis_client.web import aiohttp_handler
 from redis import asyncio as aioredis
 
 
@@ -97,10 +98,6 @@ async def gauge_view(request):
     )
 
 
-async def metrics_view(request):
-    return web.Response(body=(await REGISTRY.output()), content_type='text')
-
-
 async def prometheus_init(app):
     app['redis_pool'] = aioredis.ConnectionPool.from_url(
         "redis://localhost:6380",
@@ -129,7 +126,7 @@ def init_app():
     app.router.add_get("/histogram/{value}", histogram_view)
     app.router.add_get("/gauge/{labelname}/{value}", gauge_view)
     app.router.add_get("/gauge/{value}", gauge_view)
-    app.router.add_get("/metrics", metrics_view)
+    app.router.add_get("/metrics", aiohttp_handler(REGISTRY))
 
     app.on_startup.append(prometheus_init)
     app.on_cleanup.append(prometheus_clear)
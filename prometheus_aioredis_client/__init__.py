@@ -3,7 +3,23 @@ from .metrics import (
     Counter, Summary,
     Histogram, Gauge,
     DEFAULT_GAUGE_INDEX_KEY,
-    REGISTRY
+    REGISTRY,
+    GAUGE_MODE_ALL,
+    GAUGE_MODE_LIVEALL,
+    GAUGE_MODE_SUM,
+    GAUGE_MODE_MAX,
+    GAUGE_MODE_MIN,
+    GAUGE_MODE_MOSTRECENT
 )
-from .task_manager import TaskManager
-
+from .task_manager import (
+    TaskManager,
+    ThreadedTaskManager,
+    OVERFLOW_BLOCK,
+    OVERFLOW_DROP_NEWEST,
+    OVERFLOW_DROP_OLDEST
+)
+from .engines import MGetCollectEngine, LuaCollectEngine
+from .layouts import KeysLayout, HashLayout, KEYS_LAYOUT, HASH_LAYOUT
+from .buffer import WriteBuffer
+from .backends import RedisBackend, MemoryBackend
+from .hooks import RegistryHook, CommandBatch
@@ -0,0 +1,351 @@
+"""
+Storage backends of metric values.
+
+Backend apply batches of operations (command, key, value)
+of metric family, read all values of family, keep gauge values
+of processes and merge quantile sketches of summaries. Metrics
+and registry do not send commands directly, so storage
+can be replaced.
+
+RedisBackend store values in Redis by layout of registry.
+MemoryBackend store values in process memory.
+"""
+import asyncio
+import collections
+import time
+
+from .engines import GaugeAggregateEngine
+from .layouts import INCRBY, SET
+from .leases import GaugeIndexLeases, DEFAULT_GAUGE_INDEX_KEY
+
+
+class ApplyError(Exception):
+    """
+    Raised by 'apply_many' when some of operations were not applied.
+    'metric_ops' contain operations of failed writes.
+    """
+
+    def __init__(self, metric_ops: dict, errors: list):
+        super().__init__("Cant apply operations of {} metrics: {}".format(
+            len(metric_ops), "; ".join(repr(e) for e in errors)
+        ))
+        self.metric_ops = metric_ops
+        self.errors = errors
+
+
+class RedisBackend(object):
+    """
+    Store values in Redis. Values of metric family are written
+    by one pipeline to shard of family according to layout
+    of registry and read by collect engine of registry.
+    """
+
+    def __init__(self, gauge_index_key: str=DEFAULT_GAUGE_INDEX_KEY):
+        self._gauge_index_leases = GaugeIndexLeases(gauge_index_key)
+        self._aggregate_engine = GaugeAggregateEngine()
+
+    async def apply(self, metric, ops: list, expire: int=None) -> list:
+        """
+        Apply operations of metric in one round trip.
+        Return replies for every operation.
+        """
+        layout = metric.layout
+        async with metric.registry.pipeline(
+            transaction=layout.transaction, redis=metric.redis
+        ) as pipe:
+            layout.add_commands(pipe, metric, ops, expire)
+            replies = await pipe.execute()
+        return layout.replies(replies, expire)
+
+    async def apply_many(self, registry, metric_ops: dict):
+        """
+        Apply operations of several metrics by one pipeline per shard.
+        Shards are written concurrently. If some shards failed
+        ApplyError with operations of these shards is raised.
+        """
+        shard_ops = collections.defaultdict(dict)
+        for metric, ops in metric_ops.items():
+            shard_ops[metric.redis][metric] = ops
+        results = await asyncio.gather(*(
+            self._apply_shard(registry, redis, ops)
+            for redis, ops in shard_ops.items()
+        ), return_exceptions=True)
+        failed_ops = {}
+        errors = []
+        for ops, result in zip(shard_ops.values(), results):
+            if isinstance(result, Exception):
+                failed_ops.update(ops)
+                errors.append(result)
+        if errors:
+            raise ApplyError(failed_ops, errors)
+
+    async def _apply_shard(self, registry, redis, metric_ops: dict):
+        transaction = any(m.layout.transaction for m in metric_ops)
+        async with registry.pipeline(
+            transaction=transaction, redis=redis
+        ) as pipe:
+            for metric, ops in metric_ops.items():
+                metric.layout.add_commands(pipe, metric, ops)
+            await pipe.execute()
+
+    async def read(self, metric) -> list:
+        return await metric.layout.read(metric.registry, metric)
+
+    async def set_values(self, metric, values: list, expire: int):
+        """
+        Set (key, value) pairs with expire and add keys to group
+        in case they were expired and removed while collecting.
+        """
+        async with metric.registry.pipeline(
+            transaction=False, redis=metric.redis
+        ) as pipe:
+            for key, value in values:
+                pipe.set(key, value, ex=expire)
+            pipe.sadd(metric.get_metric_group_key(), *[k for k, _ in values])
+            await pipe.execute()
+
+    async def remove_values(self, metric, keys: list):
+        async with metric.registry.pipeline(
+            transaction=True, redis=metric.redis
+        ) as pipe:
+            group_key = metric.get_metric_group_key()
+            await pipe.srem(group_key, *keys).delete(*keys).execute()
+
+    async def set_process_values(self, metric, index: int,
+                                 values: list, expire: int):
+        """
+        Write (key, value) pairs of process to HASH fields
+        named by gauge index with current timestamp.
+        """
+        now = repr(time.time())
+        async with metric.registry.pipeline(
+            transaction=True, redis=metric.redis
+        ) as pipe:
+            for key, value in values:
+                pipe.hset(key, index, "{} {!r}".format(now, value))
+                pipe.expire(key, expire)
+            pipe.sadd(metric.get_metric_group_key(), *[k for k, _ in values])
+            await pipe.execute()
+
+    async def read_aggregated(self, metric, mode: str, expire: int) -> list:
+        return await self._aggregate_engine.read(
+            metric.redis,
+            metric.get_metric_group_key(),
+            mode,
+            time.time(),
+            expire
+        )
+
+    async def remove_process_values(self, metric, index: int, keys: list):
+        async with metric.registry.pipeline(
+            transaction=True, redis=metric.redis
+        ) as pipe:
+            for key in keys:
+                pipe.hdel(key, index)
+            await pipe.execute()
+
+    async def merge_sketches(self, metric, sketches: list):
+        """
+        Add counts of (key, bins) sketches to HASH of every key
+        by HINCRBY, so sketches of processes are merged by Redis.
+        """
+        async with metric.registry.pipeline(
+            transaction=False, redis=metric.redis
+        ) as pipe:
+            for key, bins in sketches:
+                for name, count in bins.items():
+                    pipe.hincrby(key, name, count)
+            pipe.sadd(
+                metric.get_metric_sketch_group_key(),
+                *[key for key, _ in sketches]
+            )
+            await pipe.execute()
+
+    async def read_sketches(self, metric) -> list:
+        keys = await metric.redis.smembers(
+            metric.get_metric_sketch_group_key()
+        )
+        if not keys:
+            return []
+        async with metric.registry.pipeline(
+            transaction=False, redis=metric.redis
+        ) as pipe:
+            for key in keys:
+                pipe.hgetall(key)
+            replies = await pipe.execute()
+        return [
+            (key, {
+                name.decode('utf-8'): int(count)
+                for name, count in bins.items()
+            })
+            for key, bins in zip(keys, replies)
+        ]
+
+    async def claim_gauge_index(self, registry, token: str,
+                                lease: int) -> int:
+        return await self._gauge_index_leases.claim(
+            registry.redis, token, lease
+        )
+
+    async def renew_gauge_index(self, registry, index: int, token: str,
+                                lease: int) -> bool:
+        return await self._gauge_index_leases.renew(
+            registry.redis, index, token, lease
+        )
+
+    async def release_gauge_index(self, registry, index: int,
+                                  token: str, redis=None) -> bool:
+        """
+        Release index on 'redis' client, by default on client
+        of registry.
+        """
+        return await self._gauge_index_leases.release(
+            redis or registry.redis, index, token
+        )
+
+
+def _encode(value) -> bytes:
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    return str(value).encode('utf-8')
+
+
+def _aggregate(mode: str, values: list):
+    """
+    Aggregate (timestamp, value) pairs of processes.
+    """
+    if mode == 'sum':
+        return sum(value for _, value in values)
+    if mode == 'max':
+        return max(value for _, value in values)
+    if mode == 'min':
+        return min(value for _, value in values)
+    return max(values)[1]
+
+
+class MemoryBackend(object):
+    """
+    Store values in process memory. Writes do not use network,
+    so backend fit single process applications and tests.
+    Layouts and collect engines of registry are not used.
+    Values of gauges do not expire, they are removed by cleanup.
+    Several registries of process can share one backend.
+    """
+
+    def __init__(self):
+        self._families = collections.defaultdict(dict)
+        self._process_values = collections.defaultdict(
+            lambda: collections.defaultdict(dict)
+        )
+        self._sketches = collections.defaultdict(
+            lambda: collections.defaultdict(dict)
+        )
+        self._gauge_index = 0
+        self._gauge_index_leases = {}
+
+    async def apply(self, metric, ops: list, expire: int=None) -> list:
+        values = self._families[metric.get_metric_group_key()]
+        replies = []
+        for command, key, value in ops:
+            if command == SET:
+                values[key] = repr(value) if isinstance(value, float) else value
+                replies.append(True)
+                continue
+            current = values.get(key, 0)
+            if isinstance(current, str):
+                current = float(current)
+            if command == INCRBY:
+                values[key] = current + int(value)
+            else:
+                values[key] = float(current) + float(value)
+            replies.append(values[key])
+        return replies
+
+    async def apply_many(self, registry, metric_ops: dict):
+        for metric, ops in metric_ops.items():
+            await self.apply(metric, ops)
+
+    async def read(self, metric) -> list:
+        return [
+            (key.encode('utf-8'), _encode(value))
+            for key, value in self._families[
+                metric.get_metric_group_key()
+            ].items()
+        ]
+
+    async def set_values(self, metric, values: list, expire: int):
+        await self.apply(metric, [(SET, key, value) for key, value in values])
+
+    async def remove_values(self, metric, keys: list):
+        values = self._families[metric.get_metric_group_key()]
+        for key in keys:
+            values.pop(key, None)
+
+    async def set_process_values(self, metric, index: int,
+                                 values: list, expire: int):
+        now = time.time()
+        family = self._process_values[metric.get_metric_group_key()]
+        for key, value in values:
+            family[key][index] = (now, value)
+
+    async def read_aggregated(self, metric, mode: str, expire: int) -> list:
+        now = time.time()
+        result = []
+        for key, processes in self._process_values[
+            metric.get_metric_group_key()
+        ].items():
+            for index, (timestamp, _) in list(processes.items()):
+                if now - timestamp > expire:
+                    del processes[index]
+            if processes:
+                result.append((
+                    key.encode('utf-8'),
+                    repr(float(_aggregate(mode, list(processes.values()))))
+                ))
+        return result
+
+    async def remove_process_values(self, metric, index: int, keys: list):
+        family = self._process_values[metric.get_metric_group_key()]
+        for key in keys:
+            family[key].pop(index, None)
+
+    async def merge_sketches(self, metric, sketches: list):
+        family = self._sketches[metric.get_metric_sketch_group_key()]
+        for key, bins in sketches:
+            stored = family[key]
+            for name, count in bins.items():
+                stored[name] = stored.get(name, 0) + count
+
+    async def read_sketches(self, metric) -> list:
+        return [
+            (key.encode('utf-8'), dict(bins))
+            for key, bins in self._sketches[
+                metric.get_metric_sketch_group_key()
+            ].items()
+        ]
+
+    async def claim_gauge_index(self, registry, token: str,
+                                lease: int) -> int:
+        now = time.time()
+        for index, (expire, _) in sorted(self._gauge_index_leases.items()):
+            if expire <= now:
+                break
+        else:
+            self._gauge_index += 1
+            index = self._gauge_index
+        self._gauge_index_leases[index] = (now + lease, token)
+        return index
+
+    async def renew_gauge_index(self, registry, index: int, token: str,
+                                lease: int) -> bool:
+        if self._gauge_index_leases.get(index, (0, None))[1] != token:
+            return False
+        self._gauge_index_leases[index] = (time.time() + lease, token)
+        return True
+
+    async def release_gauge_index(self, registry, index: int,
+                                  token: str, redis=None) -> bool:
+        if self._gauge_index_leases.get(index, (0, None))[1] != token:
+            return False
+        self._gauge_index_leases[index] = (0, None)
+        return True
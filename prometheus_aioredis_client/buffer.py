@@ -0,0 +1,96 @@
+import asyncio
+import collections
+import logging
+
+from .backends import ApplyError
+
+logger = logging.getLogger(__name__)
+
+
+class WriteBuffer(object):
+    """
+    Accumulate increments of counters, summaries and histograms
+    in process memory and flush them to Redis by one pipeline
+    every 'flush_interval' seconds or after 'max_pending' updates.
+    Gauges are written directly.
+    If flush failed values are returned to buffer
+    and sent by next flush.
+    """
+
+    def __init__(self, flush_interval: float=0.1, max_pending: int=1000):
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.registry = None
+        self._pending = {}
+        self._pending_updates = 0
+        self._flush_task = None
+        # periodic flush in progress, it owns swapped out values
+        self._flushing = None
+        self._close = False
+
+    @property
+    def pending_updates(self) -> int:
+        return self._pending_updates
+
+    def add(self, metric, ops: list):
+        """
+        Add operations (command, key, value) of metric.
+        Values of same command and key are summed.
+        """
+        if self._close:
+            raise Exception("Cant add values in closed write buffer.")
+        pending = self._pending
+        for command, key, value in ops:
+            op_key = (metric, command, key)
+            pending[op_key] = pending.get(op_key, 0) + value
+        self._pending_updates += 1
+
+        if self._flush_task is None:
+            self._flush_task = asyncio.create_task(self._flush_periodically())
+        if self._pending_updates >= self.max_pending:
+            self.registry.task_manager.add_task(self.flush())
+
+    async def _flush_periodically(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            # cancel of periodic task on close must not lose values
+            self._flushing = asyncio.ensure_future(self.flush())
+            await asyncio.shield(self._flushing)
+
+    async def flush(self):
+        """
+        Send all accumulated values to backend of registry.
+        Redis backend send one pipeline per shard concurrently.
+        """
+        if not self._pending:
+            return
+        pending, self._pending = self._pending, {}
+        self._pending_updates = 0
+
+        metric_ops = collections.defaultdict(list)
+        for (metric, command, key), value in pending.items():
+            metric_ops[metric].append((command, key, value))
+        try:
+            await self.registry.backend.apply_many(self.registry, metric_ops)
+        except Exception as e:
+            logger.exception("Cant flush %s metric values", len(pending))
+            if isinstance(e, ApplyError):
+                # operations of written shards are not repeated
+                metric_ops = e.metric_ops
+            self._restore(metric_ops)
+
+    def _restore(self, metric_ops: dict):
+        pending = self._pending
+        for metric, ops in metric_ops.items():
+            for command, key, value in ops:
+                op_key = (metric, command, key)
+                pending[op_key] = pending.get(op_key, 0) + value
+            self._pending_updates += 1
+
+    async def close(self):
+        self._close = True
+        if self._flush_task is not None:
+            self._flush_task.cancel()
+        if self._flushing is not None:
+            await self._flushing
+        await self.flush()
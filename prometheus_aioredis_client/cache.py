@@ -0,0 +1,57 @@
+import collections
+
+CacheInfo = collections.namedtuple(
+    'CacheInfo', ['hits', 'misses', 'maxsize', 'currsize']
+)
+
+
+class LRUCache(object):
+    """
+    Bounded cache which drop least recently used items.
+    Cache with maxsize=0 store nothing.
+    Cache can be used from several threads, items dropped
+    by other thread are ignored.
+    """
+
+    def __init__(self, maxsize: int):
+        if maxsize < 0:
+            raise ValueError("Cache size should not be negative, got {}".format(
+                maxsize
+            ))
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._data = collections.OrderedDict()
+
+    def get(self, key, factory: callable, *args):
+        """
+        Return cached value for key.
+        If key not in cache value made by factory(*args).
+        """
+        try:
+            value = self._data[key]
+        except KeyError:
+            self.misses += 1
+            value = factory(*args)
+            if self.maxsize:
+                self._data[key] = value
+                if len(self._data) > self.maxsize:
+                    try:
+                        self._data.popitem(last=False)
+                    except KeyError:
+                        pass
+            return value
+        self.hits += 1
+        try:
+            self._data.move_to_end(key)
+        except KeyError:
+            pass
+        return value
+
+    def clear(self):
+        self._data.clear()
+
+    def info(self) -> CacheInfo:
+        return CacheInfo(
+            self.hits, self.misses, self.maxsize, len(self._data)
+        )
@@ -0,0 +1,177 @@
+"""
+Engines which read all values of metric family from Redis.
+
+Engine get group key of metric and return list of pairs
+(metric key, value) for all alive members of group.
+Members without value are removed from group.
+"""
+
+
+class MGetCollectEngine(object):
+    """
+    Read members by SMEMBERS and values by chunked MGET
+    commands sent in one pipeline.
+    Stale members removed by one SREM.
+    """
+
+    async def read(self, redis, group_key: str, chunk_size: int) -> list:
+        members = list(await redis.smembers(group_key))
+        if not members:
+            return []
+
+        async with redis.pipeline(transaction=False) as pipe:
+            for start in range(0, len(members), chunk_size):
+                pipe.mget(members[start:start + chunk_size])
+            chunks = await pipe.execute()
+
+        result = []
+        stale_members = []
+        values = (value for chunk in chunks for value in chunk)
+        for metric_key, value in zip(members, values):
+            if value is None:
+                stale_members.append(metric_key)
+                continue
+            result.append((metric_key, value))
+        if stale_members:
+            await redis.srem(group_key, *stale_members)
+        return result
+
+
+COLLECT_SCRIPT = """
+if redis.replicate_commands then
+    redis.replicate_commands()
+end
+
+local members = redis.call('SMEMBERS', KEYS[1])
+local chunk_size = tonumber(ARGV[1])
+local result = {}
+local stale = {}
+
+for start = 1, #members, chunk_size do
+    local chunk = {}
+    for i = start, math.min(start + chunk_size - 1, #members) do
+        chunk[#chunk + 1] = members[i]
+    end
+    local values = redis.call('MGET', unpack(chunk))
+    for i = 1, #chunk do
+        if values[i] then
+            result[#result + 1] = chunk[i]
+            result[#result + 1] = values[i]
+        else
+            stale[#stale + 1] = chunk[i]
+        end
+    end
+end
+
+for start = 1, #stale, chunk_size do
+    redis.call(
+        'SREM', KEYS[1],
+        unpack(stale, start, math.min(start + chunk_size - 1, #stale))
+    )
+end
+
+return result
+"""
+
+
+class LuaCollectEngine(object):
+    """
+    Read members, values and prune stale members by one Lua script.
+    Script loaded once and called by EVALSHA,
+    so metric family collected in one round trip
+    and writers can not change group while reading.
+    Chunk size is limited by MAX_CHUNK_SIZE, because Lua 'unpack'
+    fails on about 8000 elements.
+    """
+
+    MAX_CHUNK_SIZE = 4096
+
+    def __init__(self):
+        self._script = None
+
+    async def read(self, redis, group_key: str, chunk_size: int) -> list:
+        if self._script is None:
+            self._script = redis.register_script(COLLECT_SCRIPT)
+        reply = await self._script(
+            keys=[group_key],
+            args=[min(chunk_size, self.MAX_CHUNK_SIZE)],
+            client=redis
+        )
+        return list(zip(reply[::2], reply[1::2]))
+
+
+AGGREGATE_GAUGE_SCRIPT = """
+if redis.replicate_commands then
+    redis.replicate_commands()
+end
+
+local mode = ARGV[1]
+local now = tonumber(ARGV[2])
+local expire = tonumber(ARGV[3])
+local members = redis.call('SMEMBERS', KEYS[1])
+local result = {}
+
+for _, member in ipairs(members) do
+    local fields = redis.call('HGETALL', member)
+    local stale = {}
+    local aggregated = nil
+    local aggregated_ts = nil
+
+    for i = 1, #fields, 2 do
+        local raw = fields[i + 1]
+        local separator = string.find(raw, ' ', 1, true)
+        local ts = tonumber(string.sub(raw, 1, separator - 1))
+        local value = tonumber(string.sub(raw, separator + 1))
+        if now - ts > expire then
+            stale[#stale + 1] = fields[i]
+        elseif aggregated == nil then
+            aggregated = value
+            aggregated_ts = ts
+        elseif mode == 'sum' then
+            aggregated = aggregated + value
+        elseif mode == 'max' then
+            aggregated = math.max(aggregated, value)
+        elseif mode == 'min' then
+            aggregated = math.min(aggregated, value)
+        elseif mode == 'mostrecent' and ts > aggregated_ts then
+            aggregated = value
+            aggregated_ts = ts
+        end
+    end
+
+    if #stale > 0 then
+        redis.call('HDEL', member, unpack(stale))
+    end
+    if aggregated == nil then
+        redis.call('SREM', KEYS[1], member)
+    else
+        result[#result + 1] = member
+        result[#result + 1] = string.format('%.17g', aggregated)
+    end
+end
+
+return result
+"""
+
+
+class GaugeAggregateEngine(object):
+    """
+    Read gauge values of all processes and aggregate them
+    by one Lua script. Every member of group is HASH where
+    field is gauge index and value is '<timestamp> <value>'.
+    Values older than 'expire' seconds are removed.
+    """
+
+    def __init__(self):
+        self._script = None
+
+    async def read(self, redis, group_key: str, mode: str,
+                   now: float, expire: int) -> list:
+        if self._script is None:
+            self._script = redis.register_script(AGGREGATE_GAUGE_SCRIPT)
+        reply = await self._script(
+            keys=[group_key],
+            args=[mode, repr(now), expire],
+            client=redis
+        )
+        return list(zip(reply[::2], reply[1::2]))
@@ -0,0 +1,180 @@
+"""
+Rendering of metric families in Prometheus text format
+and OpenMetrics format, content negotiation and gzip compression.
+"""
+import asyncio
+import gzip
+import zlib
+
+from .values import MetricValue, format_labels
+
+CONTENT_TYPE_LATEST = 'text/plain; version=0.0.4; charset=utf-8'
+CONTENT_TYPE_OPENMETRICS = 'application/openmetrics-text; version=1.0.0; charset=utf-8'
+
+# payloads bigger than this size are compressed in executor
+GZIP_EXECUTOR_THRESHOLD = 256 * 1024
+
+
+def text_family_lines(metric, values: list) -> list:
+    lines = [metric.doc_string().output()]
+    lines += [
+        v.output() for v in sorted(values, key=MetricValue.sort_key)
+    ]
+    return lines
+
+
+def _openmetrics_sort_key(metric):
+    """
+    Return sort key of samples. Samples of one label set should be
+    together, histogram buckets should be sorted by 'le' and summary
+    quantiles by 'quantile'. Other labels are user labels.
+    """
+    if metric.type == 'histogram':
+        bound_name, bound_sample = 'le', metric.name + '_bucket'
+    elif metric.type == 'summary':
+        bound_name, bound_sample = 'quantile', metric.name
+    else:
+        bound_name, bound_sample = None, None
+
+    def sort_key(value: MetricValue) -> tuple:
+        labels = value.labels or {}
+        if value.name != bound_sample or bound_name not in labels:
+            return value.labels_str, value.name, 0
+        point_labels = {
+            key: val for key, val in labels.items() if key != bound_name
+        }
+        return (
+            format_labels(point_labels), value.name,
+            float(labels[bound_name])
+        )
+
+    return sort_key
+
+
+def openmetrics_family_lines(metric, values: list) -> list:
+    """
+    Counter samples got '_total' suffix and family name lose it.
+    Histograms got '+Inf' bucket equal to '_count'.
+    """
+    family = metric.name
+    if metric.type == 'counter':
+        if family.endswith('_total'):
+            family = family[:-len('_total')]
+        values = [
+            MetricValue(
+                family + '_total', v.labels, v.value,
+                labels_str=v.labels_str
+            ) for v in values
+        ]
+    elif metric.type == 'histogram':
+        count_name = metric.name + '_count'
+        values = values + [
+            MetricValue(
+                metric.name + '_bucket',
+                labels=dict(v.labels or {}, le='+Inf'),
+                value=v.value
+            ) for v in values if v.name == count_name
+        ]
+
+    doc = metric.documentation.replace(
+        '\\', '\\\\'
+    ).replace(
+        '\n', '\\n'
+    ).replace(
+        '"', '\\"'
+    )
+    lines = [
+        "# HELP {} {}".format(family, doc),
+        "# TYPE {} {}".format(family, metric.type),
+    ]
+    lines += [
+        v.output()
+        for v in sorted(values, key=_openmetrics_sort_key(metric))
+    ]
+    return lines
+
+
+def _media_types(header: str):
+    """
+    Yield (media type, quality) from Accept-like header.
+    """
+    for part in (header or "").split(","):
+        params = part.split(";")
+        quality = 1.0
+        for param in params[1:]:
+            key, _, value = param.strip().partition("=")
+            if key == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0
+        yield params[0].strip().lower(), quality
+
+
+def choose_format(accept: str=None) -> tuple:
+    """
+    Return (openmetrics, content type) for Accept header.
+    Format with highest quality is chosen, OpenMetrics wins ties.
+    """
+    openmetrics_quality = text_quality = 0
+    for media_type, quality in _media_types(accept):
+        if media_type == 'application/openmetrics-text':
+            openmetrics_quality = max(openmetrics_quality, quality)
+        elif media_type in ('text/plain', 'text/*', '*/*'):
+            text_quality = max(text_quality, quality)
+    if openmetrics_quality > 0 and openmetrics_quality >= text_quality:
+        return True, CONTENT_TYPE_OPENMETRICS
+    return False, CONTENT_TYPE_LATEST
+
+
+def gzip_accepted(accept_encoding: str=None) -> bool:
+    return any(
+        encoding == 'gzip' and quality > 0
+        for encoding, quality in _media_types(accept_encoding)
+    )
+
+
+async def _run(func, data: bytes) -> bytes:
+    if len(data) < GZIP_EXECUTOR_THRESHOLD:
+        return func(data)
+    return await asyncio.get_running_loop().run_in_executor(
+        None, func, data
+    )
+
+
+async def compress(data: bytes) -> bytes:
+    """
+    Compress data by gzip. Big data compressed in executor.
+    """
+    return await _run(gzip.compress, data)
+
+
+class GzipStream(object):
+    """
+    Compress stream of chunks by gzip.
+    Big chunks compressed in executor.
+    """
+
+    def __init__(self):
+        self._compressor = zlib.compressobj(wbits=16 + zlib.MAX_WBITS)
+
+    async def compress(self, chunk: bytes) -> bytes:
+        return await _run(self._compressor.compress, chunk)
+
+    def flush(self) -> bytes:
+        return self._compressor.flush()
+
+
+async def generate(registry, accept: str=None,
+                   accept_encoding: str=None) -> tuple:
+    """
+    Return (body, headers) of registry output
+    for Accept and Accept-Encoding headers.
+    """
+    openmetrics, content_type = choose_format(accept)
+    body = (await registry.output(openmetrics=openmetrics)).encode('utf-8')
+    headers = {'Content-Type': content_type}
+    if gzip_accepted(accept_encoding):
+        body = await compress(body)
+        headers['Content-Encoding'] = 'gzip'
+    return body, headers
@@ -0,0 +1,106 @@
+"""
+Hooks around every batch of storage commands.
+
+Hook get CommandBatch before and after every backend operation:
+writes of metrics, gauge refresh, collect of families and gauge index
+leases. Without registered hooks backend of registry is not wrapped,
+so hooks cost nothing.
+"""
+import asyncio
+import functools
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+
+def _command_count(operation: str, args: tuple) -> int:
+    if operation in ('apply', 'set_values', 'remove_values'):
+        return len(args[1])
+    if operation == 'apply_many':
+        return sum(len(ops) for ops in args[1].values())
+    if operation == 'merge_sketches':
+        return sum(len(bins) for _, bins in args[1])
+    if operation in ('set_process_values', 'remove_process_values'):
+        return len(args[2])
+    return 1
+
+
+class CommandBatch(object):
+    """
+    Backend operation of metric family. 'metric_name' is None for
+    operations of registry like write buffer flush or gauge index leases.
+    'duration' and 'error' are set before 'on_command_batch_end'.
+    Hooks can keep own state like spans in 'context' dict.
+    """
+
+    __slots__ = (
+        "metric_name",
+        "operation",
+        "command_count",
+        "started",
+        "duration",
+        "error",
+        "context",
+    )
+
+    def __init__(self, metric_name, operation: str, command_count: int):
+        self.metric_name = metric_name
+        self.operation = operation
+        self.command_count = command_count
+        self.started = time.perf_counter()
+        self.duration = None
+        self.error = None
+        self.context = {}
+
+
+class RegistryHook(object):
+    """
+    Base class of hooks. Override methods you need.
+    """
+
+    def on_command_batch_start(self, batch: CommandBatch):
+        pass
+
+    def on_command_batch_end(self, batch: CommandBatch):
+        pass
+
+
+class HookedBackend(object):
+    """
+    Backend wrapper which call hooks around every coroutine
+    method of wrapped backend. Hook errors are logged.
+    """
+
+    def __init__(self, backend, hooks: list):
+        self.backend = backend
+        self.hooks = hooks
+
+    def __getattr__(self, name):
+        attr = getattr(self.backend, name)
+        if not asyncio.iscoroutinefunction(attr):
+            return attr
+        return functools.partial(self._call, name, attr)
+
+    def _notify(self, event: str, batch: CommandBatch):
+        for hook in self.hooks:
+            try:
+                getattr(hook, event)(batch)
+            except Exception:
+                logger.exception("Hook %s failed", event)
+
+    async def _call(self, operation: str, method, *args, **kwargs):
+        batch = CommandBatch(
+            getattr(args[0], 'name', None),
+            operation,
+            _command_count(operation, args)
+        )
+        self._notify('on_command_batch_start', batch)
+        try:
+            return await method(*args, **kwargs)
+        except Exception as e:
+            batch.error = e
+            raise
+        finally:
+            batch.duration = time.perf_counter() - batch.started
+            self._notify('on_command_batch_end', batch)
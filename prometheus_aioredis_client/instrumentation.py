@@ -0,0 +1,152 @@
+"""
+Metrics of client itself.
+
+Values are kept in process memory, so instrumentation does not
+send commands to Redis. Families are added to output of registry
+with 'prometheus_aioredis_client_' prefix when self metrics are enabled.
+"""
+import bisect
+
+from .hooks import RegistryHook
+from .values import DocStringLine, MetricValue
+
+PREFIX = 'prometheus_aioredis_client_'
+
+DEFAULT_LATENCY_BUCKETS = (
+    0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5
+)
+DEFAULT_BATCH_SIZE_BUCKETS = (1, 5, 10, 50, 100, 500, 1000, 5000)
+
+
+class LocalFamily(object):
+    """
+    Metric family stored in process memory.
+    Values are stored by tuple of label values.
+    """
+
+    type = 'untyped'
+
+    def __init__(self, name: str, documentation: str, labelnames=()):
+        self.name = PREFIX + name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+
+    def doc_string(self) -> DocStringLine:
+        return DocStringLine(self.name, self.type, self.documentation)
+
+    def _labels(self, label_values: tuple) -> dict:
+        return dict(zip(self.labelnames, label_values))
+
+    def values(self) -> list:
+        return [
+            MetricValue(self.name, self._labels(label_values), value)
+            for label_values, value in self._values.items()
+        ]
+
+
+class LocalCounter(LocalFamily):
+
+    type = 'counter'
+
+    def inc(self, value: float=1, *label_values):
+        self._values[label_values] = self._values.get(label_values, 0) + value
+
+
+class LocalGauge(LocalFamily):
+
+    type = 'gauge'
+
+    def set(self, value: float, *label_values):
+        self._values[label_values] = value
+
+
+class LocalHistogram(LocalFamily):
+
+    type = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labelnames=(),
+                 buckets=DEFAULT_LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = sorted(buckets)
+
+    def observe(self, value: float, *label_values):
+        state = self._values.get(label_values)
+        if state is None:
+            # bucket counts, sum, count
+            state = self._values[label_values] = [
+                [0] * len(self.buckets), 0, 0
+            ]
+        index = bisect.bisect_left(self.buckets, value)
+        if index < len(self.buckets):
+            state[0][index] += 1
+        state[1] += value
+        state[2] += 1
+
+    def values(self) -> list:
+        result = []
+        for label_values, (counts, total, count) in self._values.items():
+            labels = self._labels(label_values)
+            cumulative = 0
+            for bucket, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                result.append(MetricValue(
+                    self.name + '_bucket', dict(labels, le=bucket), cumulative
+                ))
+            result.append(MetricValue(self.name + '_count', labels, count))
+            result.append(MetricValue(self.name + '_sum', labels, total))
+        return result
+
+
+class ClientStats(RegistryHook):
+    """
+    Self metrics of registry: pending tasks of task manager,
+    sizes of write batches, latency and failures of backend
+    operations, duration of gauge refresh and collect of families.
+    Backend operations are measured as hook of registry.
+    """
+
+    def __init__(self, latency_buckets=DEFAULT_LATENCY_BUCKETS,
+                 batch_size_buckets=DEFAULT_BATCH_SIZE_BUCKETS):
+        self.pending_tasks = LocalGauge(
+            'pending_tasks', 'Count of tasks waiting in task manager.'
+        )
+        self.batch_size = LocalHistogram(
+            'write_batch_size', 'Count of operations in one write batch.',
+            buckets=batch_size_buckets
+        )
+        self.latency = LocalHistogram(
+            'backend_latency_seconds', 'Latency of backend operations.',
+            ['operation'], buckets=latency_buckets
+        )
+        self.failures = LocalCounter(
+            'backend_failures_total', 'Count of failed backend operations.',
+            ['operation']
+        )
+        self.refresh_duration = LocalGauge(
+            'gauge_refresh_duration_seconds',
+            'Duration of last refresh of gauge values.', ['family']
+        )
+        self.collect_duration = LocalGauge(
+            'collect_duration_seconds',
+            'Duration of last collect of metric family.', ['family']
+        )
+
+    def on_command_batch_end(self, batch):
+        self.latency.observe(batch.duration, batch.operation)
+        if batch.error is not None:
+            self.failures.inc(1, batch.operation)
+        if batch.operation in ('apply', 'apply_many'):
+            self.batch_size.observe(batch.command_count)
+
+    def families(self, registry) -> list:
+        if registry.task_manager is not None:
+            self.pending_tasks.set(registry.task_manager.pending_tasks)
+        return [
+            self.pending_tasks,
+            self.batch_size,
+            self.latency,
+            self.failures,
+            self.refresh_duration,
+            self.collect_duration,
+        ]
@@ -0,0 +1,150 @@
+"""
+Layouts define how metric values stored in Redis.
+
+Metrics describe writes as list of operations (command, key, value)
+where command is one of INCRBY, INCRBYFLOAT, SET and key is metric key
+made by Metric.get_metric_key. Layout translate operations
+to Redis commands and read values of whole metric family back.
+"""
+
+INCRBY = 'incrby'
+INCRBYFLOAT = 'incrbyfloat'
+SET = 'set'
+
+
+class KeysLayout(object):
+    """
+    Every label combination stored in own string key.
+    All keys of metric family listed in '<name>_group' set.
+    Writes wrapped in MULTI/EXEC for keep set and values consistent.
+    """
+
+    name = 'keys'
+    transaction = True
+
+    def add_commands(self, pipe, metric, ops: list, expire: int=None):
+        pipe.sadd(
+            metric.get_metric_group_key(),
+            *[key for _, key, _ in ops]
+        )
+        for command, key, value in ops:
+            getattr(pipe, command)(key, value)
+            if expire:
+                pipe.expire(key, expire)
+
+    def replies(self, replies: list, expire: int=None) -> list:
+        return replies[1::2 if expire else 1]
+
+    def remove_commands(self, pipe, metric, keys: list):
+        pipe.srem(metric.get_metric_group_key(), *keys)
+        pipe.delete(*keys)
+
+    def family_key(self, metric) -> str:
+        return metric.get_metric_group_key()
+
+    async def read(self, registry, metric) -> list:
+        return await registry.collect_engine.read(
+            metric.redis,
+            metric.get_metric_group_key(),
+            registry.collect_chunk_size
+        )
+
+
+class HashLayout(object):
+    """
+    Every metric family stored in one '<name>_hash' HASH.
+    Fields are metric keys. Writes are single HINCRBY/HINCRBYFLOAT
+    commands without transaction, collect is one HGETALL.
+    Values can not expire, so gauges always use KeysLayout.
+    """
+
+    name = 'hash'
+    transaction = False
+
+    COMMANDS = {
+        INCRBY: 'hincrby',
+        INCRBYFLOAT: 'hincrbyfloat',
+        SET: 'hset',
+    }
+
+    def add_commands(self, pipe, metric, ops: list, expire: int=None):
+        if expire:
+            raise ValueError("Hash layout does not support expire")
+        hash_key = metric.get_metric_hash_key()
+        for command, key, value in ops:
+            getattr(pipe, self.COMMANDS[command])(hash_key, key, value)
+
+    def replies(self, replies: list, expire: int=None) -> list:
+        return replies
+
+    def remove_commands(self, pipe, metric, keys: list):
+        pipe.hdel(metric.get_metric_hash_key(), *keys)
+
+    def family_key(self, metric) -> str:
+        return metric.get_metric_hash_key()
+
+    async def read(self, registry, metric) -> list:
+        return list((await metric.redis.hgetall(
+            metric.get_metric_hash_key()
+        )).items())
+
+
+KEYS_LAYOUT = KeysLayout()
+HASH_LAYOUT = HashLayout()
+
+
+# KEYS: source family key, target family key, metric keys;
+# ARGV: source layout name, target layout name
+MIGRATE_SCRIPT = """
+local moved = 0
+for i = 3, #KEYS do
+    local key = KEYS[i]
+    local value
+    if ARGV[1] == 'keys' then
+        value = redis.call('GET', key)
+        redis.call('DEL', key)
+        redis.call('SREM', KEYS[1], key)
+    else
+        value = redis.call('HGET', KEYS[1], key)
+        redis.call('HDEL', KEYS[1], key)
+    end
+    if value then
+        local command = 'INCRBYFLOAT'
+        if string.match(value, '^-?%d+$') then
+            command = 'INCRBY'
+        end
+        if ARGV[2] == 'keys' then
+            redis.call('SADD', KEYS[2], key)
+            redis.call(command, key, value)
+        else
+            redis.call('H' .. command, KEYS[2], key, value)
+        end
+        moved = moved + 1
+    end
+end
+return moved
+"""
+
+
+async def migrate(registry, metric, source, target) -> int:
+    """
+    Move values of metric from 'source' layout to 'target' layout.
+    Values are added to target, so increments made by processes
+    which already use target layout are kept.
+    Every chunk of keys is read, removed and added to target
+    by one Lua script, so increments of processes which still use
+    source layout are not lost. Return count of moved values.
+    """
+    keys = [key for key, _ in await source.read(registry, metric)]
+    script = metric.redis.register_script(MIGRATE_SCRIPT)
+    chunk_size = registry.collect_chunk_size
+    moved = 0
+    for start in range(0, len(keys), chunk_size):
+        moved += await script(
+            keys=[
+                source.family_key(metric), target.family_key(metric)
+            ] + keys[start:start + chunk_size],
+            args=[source.name, target.name],
+            client=metric.redis
+        )
+    return moved
@@ -0,0 +1,95 @@
+"""
+Leases of gauge indexes.
+
+Index of process is member of sorted set scored by lease expire time.
+Process claim index with expired lease or new index by INCR
+of global counter, renew lease periodically and release it on close.
+So indexes of dead processes are reused and count of gauge series
+is bounded by count of live processes.
+
+Lease keys use hash tag of counter key, so all keys
+of scripts are in one slot of Redis Cluster.
+"""
+
+DEFAULT_GAUGE_INDEX_KEY = 'GLOBAL_GAUGE_INDEX'
+
+LEASE_PREFIX = """
+if redis.replicate_commands then
+    redis.replicate_commands()
+end
+
+local time = redis.call('TIME')
+local now = tonumber(time[1]) + tonumber(time[2]) / 1000000
+"""
+
+# KEYS: counter, leases, owners; ARGV: token, lease
+CLAIM_SCRIPT = LEASE_PREFIX + """
+local index = redis.call(
+    'ZRANGEBYSCORE', KEYS[2], '-inf', now, 'LIMIT', 0, 1
+)[1]
+if not index then
+    index = redis.call('INCR', KEYS[1])
+end
+redis.call('ZADD', KEYS[2], now + tonumber(ARGV[2]), index)
+redis.call('HSET', KEYS[3], index, ARGV[1])
+return tonumber(index)
+"""
+
+# KEYS: leases, owners; ARGV: index, token, lease
+RENEW_SCRIPT = LEASE_PREFIX + """
+if redis.call('HGET', KEYS[2], ARGV[1]) ~= ARGV[2] then
+    return 0
+end
+redis.call('ZADD', KEYS[1], now + tonumber(ARGV[3]), ARGV[1])
+return 1
+"""
+
+# KEYS: leases, owners; ARGV: index, token
+RELEASE_SCRIPT = """
+if redis.call('HGET', KEYS[2], ARGV[1]) ~= ARGV[2] then
+    return 0
+end
+redis.call('HDEL', KEYS[2], ARGV[1])
+redis.call('ZADD', KEYS[1], 0, ARGV[1])
+return 1
+"""
+
+
+class GaugeIndexLeases(object):
+    """
+    Claim, renew and release gauge indexes by Lua scripts.
+    Owner of index is checked by random token of process,
+    so process which lost lease can not renew index of other process.
+    """
+
+    def __init__(self, counter_key: str):
+        self.counter_key = counter_key
+        self.leases_key = "{{{}}}_leases".format(counter_key)
+        self.owners_key = "{{{}}}_owners".format(counter_key)
+        self._scripts = {}
+
+    def _script(self, redis, script: str):
+        if script not in self._scripts:
+            self._scripts[script] = redis.register_script(script)
+        return self._scripts[script]
+
+    async def claim(self, redis, token: str, lease: int) -> int:
+        return await self._script(redis, CLAIM_SCRIPT)(
+            keys=[self.counter_key, self.leases_key, self.owners_key],
+            args=[token, lease],
+            client=redis
+        )
+
+    async def renew(self, redis, index: int, token: str, lease: int) -> bool:
+        return bool(await self._script(redis, RENEW_SCRIPT)(
+            keys=[self.leases_key, self.owners_key],
+            args=[index, token, lease],
+            client=redis
+        ))
+
+    async def release(self, redis, index: int, token: str) -> bool:
+        return bool(await self._script(redis, RELEASE_SCRIPT)(
+            keys=[self.leases_key, self.owners_key],
+            args=[index, token],
+            client=redis
+        ))
@@ -1,35 +1,134 @@
 import copy
 import json
 import base64
-from functools import partial
-import asyncio
+import bisect
 import collections
-from .values import DocStringLine, MetricValue
+import math
+import time
+from .values import DocStringLine, MetricValue, format_labels
+from .layouts import INCRBY, INCRBYFLOAT, SET, KEYS_LAYOUT
+from .cache import LRUCache
+from .sketch import DDSketch, DEFAULT_RELATIVE_ACCURACY, DEFAULT_MAX_BINS
 
 from .registry import Registry
+from .leases import DEFAULT_GAUGE_INDEX_KEY
 from .task_manager import TaskManager
 
 REGISTRY = Registry(task_manager=TaskManager())
 
 
-DEFAULT_GAUGE_INDEX_KEY = 'GLOBAL_GAUGE_INDEX'
+DEFAULT_KEY_CACHE_SIZE = 4096
+
+GAUGE_MODE_ALL = 'all'
+GAUGE_MODE_LIVEALL = 'liveall'
+GAUGE_MODE_SUM = 'sum'
+GAUGE_MODE_MAX = 'max'
+GAUGE_MODE_MIN = 'min'
+GAUGE_MODE_MOSTRECENT = 'mostrecent'
+
+GAUGE_MODES = (
+    GAUGE_MODE_ALL,
+    GAUGE_MODE_LIVEALL,
+    GAUGE_MODE_SUM,
+    GAUGE_MODE_MAX,
+    GAUGE_MODE_MIN,
+    GAUGE_MODE_MOSTRECENT,
+)
+
+def _cache_key(values: tuple) -> tuple:
+    """
+    Cache key of label values. Values like 1, 1.0 and True are equal,
+    but packed to different Redis keys, so types are part of key.
+    """
+    return values + tuple(type(value) for value in values)
+
+
+HistogramKeys = collections.namedtuple(
+    'HistogramKeys', ['count', 'sum', 'buckets']
+)
+
+
+def _decode_value(value: bytes) -> str:
+    return value.decode('utf-8')
+
+
+def _aggregated_value(value):
+    value = float(value)
+    return int(value) if value.is_integer() else value
 
 
 class WithLabels(object):
-    __slot__ = (
+    """
+    Metric with bound label values.
+    Made by Metric.labels once for every label values
+    and carry already checked labels and Redis keys.
+    """
+
+    __slots__ = (
         "instance",
-        "labels"
+        "labels",
+        "keys",
     )
 
-    def __init__(self, instance, labels: dict):
+    def __init__(self, instance, labels: dict, keys):
         self.instance = instance
         self.labels = labels
+        self.keys = keys
+
+
+class CounterWithLabels(WithLabels):
+
+    __slots__ = ()
+
+    def inc(self, value: int=1):
+        self.instance._inc(value, self.keys)
+
+    async def a_inc(self, value: int=1):
+        return await self.instance._a_inc(value, self.keys)
+
 
-    def __getattr__(self, item):
-        attr = getattr(self.instance, item)
-        if not callable(attr):
-            raise TypeError("Labels work with function only")
-        return partial(attr, labels=self.labels)
+class ObserveWithLabels(WithLabels):
+
+    __slots__ = ()
+
+    def observe(self, value: float):
+        self.instance._observe(value, self.keys)
+
+    async def a_observe(self, value: float):
+        return await self.instance._a_observe(value, self.keys)
+
+
+class GaugeWithLabels(WithLabels):
+    """
+    Gauge keys contain index of process,
+    so they are taken from keys cache of gauge.
+    """
+
+    __slots__ = ()
+
+    def inc(self, value: float):
+        self.instance.registry.task_manager.add_task(
+            self.instance._a_inc(value, self.labels)
+        )
+
+    async def a_inc(self, value: float=1):
+        return await self.instance._a_inc(value, self.labels)
+
+    def dec(self, value: float):
+        self.instance.registry.task_manager.add_task(
+            self.instance._a_inc(-value, self.labels)
+        )
+
+    async def a_dec(self, value: float=1):
+        return await self.instance._a_inc(-value, self.labels)
+
+    def set(self, value: float):
+        self.instance.registry.task_manager.add_task(
+            self.instance._a_set(value, self.labels)
+        )
+
+    async def a_set(self, value: float=1):
+        return await self.instance._a_set(value, self.labels)
 
 
 class Metric(object):
@@ -40,14 +139,20 @@ class Metric(object):
 
     minion = None
     type = ''
+    labels_class = WithLabels
 
     def __init__(self, name: str,
                  documentation: str, labelnames: list=None,
-                 registry: Registry=REGISTRY):
+                 registry: Registry=REGISTRY,
+                 key_cache_size: int=DEFAULT_KEY_CACHE_SIZE):
         self.documentation = documentation
         self.labelnames = labelnames or []
         self.name = name
         self.registry = registry
+        self._key_cache = LRUCache(key_cache_size)
+        self._children = LRUCache(key_cache_size)
+        # name and parsed labels of last collect by metric key
+        self._labels_cache = {}
         self.registry.add_metric(self)
 
     def doc_string(self) -> DocStringLine:
@@ -57,39 +162,122 @@ class Metric(object):
             self.documentation
         )
 
+    @property
+    def layout(self):
+        return self.registry.layout
+
+    @property
+    def redis(self):
+        # shard of metric family
+        return self.registry.get_redis(self.name)
+
     async def collect(self) -> list:
-        redis = self.registry.redis
-        group_key = self.get_metric_group_key()
-        members = await redis.smembers(
-            group_key
+        return self._metric_values(
+            await self.registry.backend.read(self), _decode_value
         )
 
+    def _metric_values(self, pairs: list, parse_value) -> list:
+        """
+        Make metric values from (metric key, value) pairs.
+        Parsed keys are kept until next collect, so cache
+        holds every series of family whatever size of key cache is
+        and labels of removed series are dropped.
+        """
+        cache, parsed_keys = self._labels_cache, {}
         result = []
-        for metric_key in members:
-            name, packed_labels = self.parse_metric_key(metric_key)
-            labels = self.unpack_labels(packed_labels)
-            value = await redis.get(metric_key)
-            if value is None:
-                await redis.srem(group_key, metric_key)
-                continue
+        for metric_key, value in pairs:
+            parsed = cache.get(metric_key)
+            if parsed is None:
+                name, packed_labels = self.parse_metric_key(metric_key)
+                parsed = (name,) + self._parse_labels(packed_labels)
+            parsed_keys[metric_key] = parsed
+            name, labels, labels_str = parsed
             result.append(MetricValue(
                 name=name,
                 labels=labels,
-                value=value.decode('utf-8')
+                value=parse_value(value),
+                labels_str=labels_str
             ))
+        self._labels_cache = parsed_keys
         return result
 
+    def _parse_labels(self, packed_labels: str) -> tuple:
+        """
+        Return labels and rendered labels string.
+        Result is cached, so labels should not be changed.
+        """
+        labels = self.unpack_labels(packed_labels)
+        return labels, format_labels(labels)
+
+    async def _write(self, ops: list, expire: int=None) -> list:
+        """
+        Apply operations (command, key, value) in one round trip.
+        Return replies for every operation.
+        """
+        return await self.registry.backend.apply(self, ops, expire)
+
+    def _write_later(self, ops: list):
+        """
+        Apply operations without waiting.
+        Operations are accumulated in write buffer of registry
+        or applied by task of task manager.
+        """
+        write_buffer = self.registry.write_buffer
+        if write_buffer is None:
+            self.registry.task_manager.add_task(self._write(ops))
+        else:
+            self.registry.task_manager.call_soon(write_buffer.add, self, ops)
+
+    def get_family_key(self, suffix: str=None):
+        """
+        Return name of family key. In cluster mode name is hash tag,
+        so all keys of metric family are stored in one slot.
+        """
+        if self.registry.cluster_mode:
+            return "{{{}}}{}".format(self.name, suffix or "")
+        return "{}{}".format(self.name, suffix or "")
+
     def get_metric_group_key(self):
-        return "{}_group".format(self.name)
+        return self.get_family_key("_group")
+
+    def get_metric_hash_key(self):
+        return self.get_family_key("_hash")
+
+    def get_metric_sketch_group_key(self):
+        return self.get_family_key("_sketch_group")
 
     def get_metric_key(self, labels, suffix: str=None):
-        return "{}{}:{}".format(
-            self.name, suffix or "",
+        return "{}:{}".format(
+            self.get_family_key(suffix),
             self.pack_labels(labels).decode('utf-8')
         )
 
+    def _get_keys(self, labels: dict):
+        """
+        Return Redis keys for labels from LRU cache.
+        Cache key is tuple of label values and their types.
+        """
+        return self._key_cache.get(
+            _cache_key(tuple(labels[name] for name in self.labelnames)),
+            self._make_keys,
+            labels
+        )
+
+    def _make_keys(self, labels: dict):
+        return self.get_metric_key(labels)
+
+    def key_cache_info(self):
+        """
+        Return (hits, misses, maxsize, currsize) of label keys cache.
+        """
+        return self._key_cache.info()
+
     def parse_metric_key(self, key) -> (str, dict):
-        return key.decode('utf-8').split(':', maxsplit=1)
+        name, packed_labels = key.decode('utf-8').split(':', maxsplit=1)
+        if name.startswith('{'):
+            # hash tag of cluster mode
+            name = name[1:].replace('}', '', 1)
+        return name, packed_labels
 
     def pack_labels(self, labels: dict) -> bytes:
         return base64.b64encode(
@@ -107,11 +295,27 @@ class Metric(object):
             ))
 
     def labels(self, *args, **kwargs):
-        labels = dict(zip(self.labelnames, args))
-        labels.update(kwargs)
-        return WithLabels(
+        """
+        Return metric with bound label values.
+        Object is cached by tuple of label values and their types.
+        """
+        if kwargs:
+            labels = dict(zip(self.labelnames, args))
+            labels.update(kwargs)
+            self._check_labels(labels)
+            args = tuple(labels[name] for name in self.labelnames)
+        elif len(args) != len(self.labelnames):
+            raise ValueError("Expect {} label values, got {}".format(
+                len(self.labelnames), len(args)
+            ))
+        return self._children.get(_cache_key(args), self._make_child, args)
+
+    def _make_child(self, values: tuple) -> WithLabels:
+        labels = dict(zip(self.labelnames, values))
+        return self.labels_class(
             instance=self,
-            labels=labels
+            labels=labels,
+            keys=self._get_keys(labels)
         )
 
     async def cleanup(self):
@@ -121,94 +325,239 @@ class Metric(object):
 class Counter(Metric):
 
     type = 'counter'
+    labels_class = CounterWithLabels
 
     def inc(self, value: int=1, labels=None):
         labels = labels or {}
         self._check_labels(labels)
-        self.registry.task_manager.add_task(
-            self._a_inc(value, labels)
-        )
+        self._inc(value, self._get_keys(labels))
 
     async def a_inc(self, value: int = 1, labels=None):
         labels = labels or {}
         self._check_labels(labels)
-        return await self._a_inc(value, labels)
+        return await self._a_inc(value, self._get_keys(labels))
 
-    async def _a_inc(self, value: int = 1, labels=None):
-        """
-        Calculate metric with labels redis key.
-        Add this key to set of key for this metric.
-        """
+    def _inc_ops(self, value: int, metric_key: str) -> list:
         if not isinstance(value, int):
             raise ValueError("Value should be int, got {}".format(
                 type(value)
             ))
-        group_key = self.get_metric_group_key()
-        metric_key = self.get_metric_key(labels)
+        return [(INCRBY, metric_key, value)]
 
-        async with self.registry.redis.pipeline(transaction=True) as pipe:
-            _, future_answer = (await pipe.sadd(group_key, metric_key).incrby(metric_key, int(value)).execute())
+    def _inc(self, value: int, metric_key: str):
+        self._write_later(self._inc_ops(value, metric_key))
+
+    async def _a_inc(self, value: int, metric_key: str):
+        """
+        Increment value of metric key.
+        """
+        future_answer, = await self._write(
+            self._inc_ops(value, metric_key)
+        )
         return future_answer
 
 
 class Summary(Metric):
+    """
+    If 'quantiles' are set every process count observed values
+    in local DDSketch for every label set and merge sketches
+    to Redis by refresher of task manager, so cost of writes
+    does not depend on count of observations. Quantiles are
+    accurate within 'relative_accuracy' of value and sketches
+    keep at most 'max_bins' bins. Sketches are stored
+    with '_sketch' suffix. Infinite and NaN values are skipped,
+    because Redis can not add them to '_sum', so '_sum' and
+    '_count' always describe the same observations.
+    """
 
     type = 'summary'
+    labels_class = ObserveWithLabels
+
+    def __init__(self, name: str, documentation: str, labelnames: list=None,
+                 *args, quantiles=(),
+                 relative_accuracy: float=DEFAULT_RELATIVE_ACCURACY,
+                 max_bins: int=DEFAULT_MAX_BINS,
+                 **kwargs):
+        for q in quantiles:
+            if not 0 <= q <= 1:
+                raise ValueError("Quantile should be in [0, 1], got {}".format(q))
+        if quantiles and 'quantile' in (labelnames or []):
+            raise ValueError("Label 'quantile' is reserved for quantiles")
+        self.quantiles = tuple(sorted(quantiles))
+        self.relative_accuracy = relative_accuracy
+        self.max_bins = max_bins
+        # check arguments of sketch before metric is added to registry
+        self._make_sketch()
+        self._sketches = {}
+        self._refresher_added = False
+        super().__init__(name, documentation, labelnames, *args, **kwargs)
 
     async def a_observe(self, value: float, labels=None):
         labels = labels or {}
         self._check_labels(labels)
-        return await self._a_observe(value, labels)
+        return await self._a_observe(value, self._get_keys(labels))
 
     def observe(self, value, labels=None):
         labels = labels or {}
         self._check_labels(labels)
-        self.registry.task_manager.add_task(
-            self._a_observe(value, labels)
+        self._observe(value, self._get_keys(labels))
+
+    def _make_keys(self, labels: dict):
+        keys = (
+            self.get_metric_key(labels, "_sum"),
+            self.get_metric_key(labels, "_count"),
         )
+        if self.quantiles:
+            keys += (self.get_metric_key(labels, "_sketch"),)
+        return keys
+
+    def _make_sketch(self) -> DDSketch:
+        return DDSketch(self.relative_accuracy, self.max_bins)
+
+    def _observe_ops(self, value: float, keys: tuple) -> list:
+        sum_metric_key, count_metric_key = keys[:2]
+        return [
+            (INCRBYFLOAT, sum_metric_key, float(value)),
+            (INCRBY, count_metric_key, 1),
+        ]
 
-    async def _a_observe(self, value: float, labels=None):
+    def _observe(self, value: float, keys: tuple):
+        if not math.isfinite(value):
+            return
+        if self.quantiles:
+            self.registry.task_manager.call_soon(
+                self._sketch_observe, value, keys[2]
+            )
+        self._write_later(self._observe_ops(value, keys))
+
+    async def _a_observe(self, value: float, keys: tuple):
+        if not math.isfinite(value):
+            return None
+        if self.quantiles:
+            self._sketch_observe(value, keys[2])
+        future_answer, _ = await self._write(
+            self._observe_ops(value, keys)
+        )
+        return future_answer
 
-        group_key = self.get_metric_group_key()
-        sum_metric_key = self.get_metric_key(labels, "_sum")
-        count_metric_key = self.get_metric_key(labels, "_count")
+    def _sketch_observe(self, value: float, sketch_key: str):
+        sketch = self._sketches.get(sketch_key)
+        if sketch is None:
+            sketch = self._sketches[sketch_key] = self._make_sketch()
+        sketch.add(float(value))
+        if not self._refresher_added:
+            self._refresher_added = True
+            self.registry.task_manager.add_task(self.add_refresher())
 
-        async with self.registry.redis.pipeline(transaction=True) as pipe:
-            _, future_answer, _ = (
-                await pipe.sadd(group_key, count_metric_key, sum_metric_key)
-                .incrbyfloat(sum_metric_key, float(value))
-                .incr(count_metric_key)
-                .execute()
+    async def add_refresher(self):
+        try:
+            await self.registry.task_manager.add_refresher(
+                self.flush_sketches
             )
+        except Exception:
+            self._refresher_added = False
+            raise
 
-        return future_answer
+    async def flush_sketches(self):
+        """
+        Merge counts observed since last flush to Redis.
+        Counts are kept locally if merge failed.
+        """
+        sketches, self._sketches = self._sketches, {}
+        if not sketches:
+            return
+        try:
+            await self.registry.backend.merge_sketches(self, [
+                (key, sketch.bins) for key, sketch in sketches.items()
+            ])
+        except Exception:
+            for key, sketch in sketches.items():
+                self._sketches.setdefault(
+                    key, self._make_sketch()
+                ).merge(sketch.bins)
+            raise
+
+    async def collect(self) -> list:
+        result = await super().collect()
+        if not self.quantiles:
+            return result
+        for metric_key, bins in await self.registry.backend.read_sketches(self):
+            _, packed_labels = self.parse_metric_key(metric_key)
+            labels = self.unpack_labels(packed_labels)
+            sketch = self._make_sketch()
+            sketch.merge(bins)
+            if sketch.count == 0:
+                continue
+            for q in self.quantiles:
+                result.append(MetricValue(
+                    self.name,
+                    labels=dict(labels, quantile=q),
+                    value=sketch.quantile(q)
+                ))
+        return result
+
+    async def cleanup(self):
+        await self.flush_sketches()
 
 
 class Gauge(Metric):
+    """
+    Every process write own values marked by 'gauge_index' label.
+
+    'multiprocess_mode' define how values of processes are exported:
+    'all' and 'liveall' - every value of alive process with 'gauge_index'
+    label, 'sum', 'max', 'min', 'mostrecent' - one value per label set
+    aggregated by Redis while collecting.
+    Values of dead processes are removed after 'expire' seconds.
+    """
 
     type = 'gauge'
+    labels_class = GaugeWithLabels
 
     DEFAULT_EXPIRE = 60
+    REFRESH_CHUNK_SIZE = 1000
 
     def __init__(self, *args,
                  expire=DEFAULT_EXPIRE,
                  refresh_enable=True,
+                 multiprocess_mode=GAUGE_MODE_ALL,
                  **kwargs):
+        if multiprocess_mode not in GAUGE_MODES:
+            raise ValueError("Multiprocess mode should be one of {}, got {}".format(
+                ", ".join(GAUGE_MODES), multiprocess_mode
+            ))
         super().__init__(*args, **kwargs)
+        self.multiprocess_mode = multiprocess_mode
+        self.aggregated = multiprocess_mode not in (
+            GAUGE_MODE_ALL, GAUGE_MODE_LIVEALL
+        )
 
         self.refresh_enable = refresh_enable
         self._refresher_added = False
-        self.lock = asyncio.Lock()
         self.gauge_values = collections.defaultdict(lambda: 0)
         self.expire = expire
-        self.index = None
+
+    @property
+    def index(self):
+        # one index for all gauges of registry
+        return self.registry.gauge_index
+
+    @property
+    def layout(self):
+        # gauge values expire with process, so they need own keys
+        return KEYS_LAYOUT
 
     async def add_refresher(self):
         if self.refresh_enable and not self._refresher_added:
-            await self.registry.task_manager.add_refresher(
-                self.refresh_values
-            )
+            # mark before await, so concurrent updates add it once
             self._refresher_added = True
+            try:
+                await self.registry.task_manager.add_refresher(
+                    self.refresh_values
+                )
+            except Exception:
+                self._refresher_added = False
+                raise
 
     def _set_internal(self, key: str, value: float):
         self.gauge_values[key] = value
@@ -236,24 +585,59 @@ class Gauge(Metric):
         self._check_labels(labels)
         return await self._a_inc(-value, labels)
 
-    async def _a_inc(self, value: float, labels: dict):
-        async with self.lock:
-            group_key = self.get_metric_group_key()
-            labels['gauge_index'] = await self.get_gauge_index()
-            metric_key = self.get_metric_key(labels)
-
-            async with self.registry.redis.pipeline(transaction=True) as pipe:
-                _, future_answer, _ = (
-                    await pipe.sadd(group_key, metric_key)
-                    .incrbyfloat(metric_key, float(value))
-                    .expire(metric_key, self.expire)
-                    .execute()
-                )
-                self._inc_internal(metric_key, float(value))
+    def _make_keys(self, labels: dict):
+        if self.aggregated:
+            # one HASH for label set, process index is field of it
+            return self.get_metric_key(labels)
+        labels = dict(labels, gauge_index=self.index)
+        return self.get_metric_key(labels)
+
+    async def _write_aggregated(self, values: list):
+        """
+        Write (key, value) pairs of process marked by gauge index.
+        """
+        await self.registry.backend.set_process_values(
+            self, self.index, values, self.expire
+        )
 
+    async def collect(self) -> list:
+        if not self.aggregated:
+            return await super().collect()
+        return self._metric_values(
+            await self.registry.backend.read_aggregated(
+                self, self.multiprocess_mode, self.expire
+            ),
+            _aggregated_value
+        )
+
+    def _make_child(self, values: tuple) -> WithLabels:
+        return self.labels_class(
+            instance=self,
+            labels=dict(zip(self.labelnames, values)),
+            keys=None
+        )
+
+    async def _a_inc(self, value: float, labels: dict):
+        """
+        Updates are not locked. Local value is changed before
+        first await, so it keeps order of calls. Redis increments
+        are commutative and refresh_values rewrites absolute values.
+        """
+        if self.index is None:
+            await self.get_gauge_index()
+        metric_key = self._get_keys(labels)
+        self._inc_internal(metric_key, float(value))
+        if not self._refresher_added:
             await self.add_refresher()
 
+        if self.aggregated:
+            future_answer = self.gauge_values[metric_key]
+            await self._write_aggregated([(metric_key, future_answer)])
             return future_answer
+        future_answer, = await self._write([
+            (INCRBYFLOAT, metric_key, float(value)),
+        ], expire=self.expire)
+        return future_answer
 
     def set(self, value: float, labels=None):
         labels = labels or {}
@@ -266,89 +650,164 @@ class Gauge(Metric):
         return await self._a_set(value, labels)
 
     async def _a_set(self, value: float, labels: dict):
-        async with self.lock:
-            group_key = self.get_metric_group_key()
-            labels['gauge_index'] = await self.get_gauge_index()
-            metric_key = self.get_metric_key(labels)
-
-            async with self.registry.redis.pipeline(transaction=True) as pipe:
-                _, future_answer, _ = (
-                    await pipe.sadd(group_key, metric_key)
-                    .set(metric_key, float(value))
-                    .expire(metric_key, self.expire)
-                    .execute()
-                )
-                self._set_internal(metric_key, float(value))
+        if self.index is None:
+            await self.get_gauge_index()
+        metric_key = self._get_keys(labels)
+        self._set_internal(metric_key, float(value))
+        if not self._refresher_added:
             await self.add_refresher()
 
-            return future_answer
+        if self.aggregated:
+            await self._write_aggregated([(metric_key, float(value))])
+            return True
+        future_answer, = await self._write([
+            (SET, metric_key, float(value)),
+        ], expire=self.expire)
+        return future_answer
 
     async def get_gauge_index(self):
-        if self.index is None:
-            self.index = await self.make_gauge_index()
-        return self.index
+        return await self.registry.get_gauge_index()
 
-    async def make_gauge_index(self):
-        index = await self.registry.redis.incr(
-            DEFAULT_GAUGE_INDEX_KEY
-        )
-        await self.registry.task_manager.add_refresher(
-            self.refresh_values
-        )
-        return index
+    def move_to_gauge_index(self):
+        """
+        Rebuild keys of process values after gauge index of registry
+        was changed. Values are written by next refresh_values.
+        """
+        self._key_cache.clear()
+        values = self.gauge_values
+        self.gauge_values = collections.defaultdict(lambda: 0)
+        for key, value in values.items():
+            _, packed_labels = self.parse_metric_key(key.encode('utf-8'))
+            labels = self.unpack_labels(packed_labels)
+            labels.pop('gauge_index', None)
+            self.gauge_values[self._get_keys(labels)] = value
 
     async def refresh_values(self):
-        async with self.lock:
-            for key, value in self.gauge_values.items():
-                await self.registry.redis.set(key, value)
-                await self.registry.redis.expire(key, self.expire)
-    
+        """
+        Rewrite all values of process with new expire.
+        Values are copied and sent by chunks.
+        Redis backend send pipelines of 'SET key value EX expire'
+        commands and add keys to group again in case
+        they were expired and removed while collecting.
+        """
+        if self.gauge_values and self.index is None:
+            # index was reset by set_redis, values are moved to new index
+            await self.get_gauge_index()
+        stats = self.registry.stats
+        started = time.perf_counter()
+        values = list(self.gauge_values.items())
+        for start in range(0, len(values), self.REFRESH_CHUNK_SIZE):
+            chunk = values[start:start + self.REFRESH_CHUNK_SIZE]
+            if self.aggregated:
+                await self._write_aggregated(chunk)
+            else:
+                await self.registry.backend.set_values(
+                    self, chunk, self.expire
+                )
+        if stats is not None:
+            stats.refresh_duration.set(
+                time.perf_counter() - started, self.name
+            )
+
     async def cleanup(self):
-        async with self.lock:
-            group_key = self.get_metric_group_key()
-            keys = list(self.gauge_values.keys())
-            if len(keys) == 0:
-                return
-            async with self.registry.redis.pipeline(transaction=True) as pipe:
-                await pipe.srem(group_key, *keys).delete(*keys).execute()
+        keys = list(self.gauge_values.keys())
+        if len(keys) == 0:
+            return
+        if self.aggregated:
+            await self.registry.backend.remove_process_values(
+                self, self.index, keys
+            )
+        else:
+            await self.registry.backend.remove_values(self, keys)
 
 
 class Histogram(Metric):
 
     type = 'histogram'
+    labels_class = ObserveWithLabels
 
-    def __init__(self, *args, buckets: list, **kwargs):
+    def __init__(self, *args, buckets: list, cumulative=True, **kwargs):
+        """
+        If 'cumulative' is False observe increment only one bucket
+        which value falls into and cumulative counts are calculated
+        while collecting. Such buckets stored with '_raw_bucket' suffix.
+        """
         super().__init__(*args, **kwargs)
         self.buckets = sorted(buckets, reverse=True)
+        self.cumulative = cumulative
+        self._ascending_buckets = sorted(buckets)
 
     async def a_observe(self, value: float, labels=None):
         labels = labels or {}
         self._check_labels(labels)
-        return await self._a_observe(value, labels)
+        return await self._a_observe(value, self._get_keys(labels))
 
     def observe(self, value, labels=None):
         labels = labels or {}
         self._check_labels(labels)
-        self.registry.task_manager.add_task(
-            self._a_observe(value, labels)
+        self._observe(value, self._get_keys(labels))
+
+    def _make_keys(self, labels: dict):
+        suffix = '_bucket' if self.cumulative else '_raw_bucket'
+        return HistogramKeys(
+            count=self.get_metric_key(labels, '_count'),
+            sum=self.get_metric_key(labels, '_sum'),
+            buckets=tuple(
+                self.get_metric_key(dict(labels, le=bucket), suffix)
+                for bucket in self._ascending_buckets
+            )
         )
 
-    async def _a_observe(self, value: float, labels):
-        group_key = self.get_metric_group_key()
-        sum_key = self.get_metric_key(labels, '_sum')
-        counter_key = self.get_metric_key(labels, '_count')
-        async with self.registry.redis.pipeline(transaction=True) as pipe:
-            for bucket in self.buckets:
-                if value > bucket:
-                    break
+    def _observe_ops(self, value: float, keys: HistogramKeys) -> list:
+        ops = [
+            (INCRBY, keys.count, 1),
+            (INCRBYFLOAT, keys.sum, float(value)),
+        ]
+        # buckets are sorted ascending, so value falls into first bucket
+        # which is greater or equal than value
+        index = bisect.bisect_left(self._ascending_buckets, value)
+        if self.cumulative:
+            ops.extend((INCRBY, key, 1) for key in keys.buckets[index:])
+        elif index < len(keys.buckets):
+            ops.append((INCRBY, keys.buckets[index], 1))
+        return ops
+
+    def _observe(self, value: float, keys: HistogramKeys):
+        self._write_later(self._observe_ops(value, keys))
+
+    async def _a_observe(self, value: float, keys: HistogramKeys):
+        await self._write(self._observe_ops(value, keys))
+
+    def _accumulate_buckets(self, redis_metric_values):
+        """
+        Replace '_raw_bucket' values by cumulative '_bucket' values.
+        """
+        raw_name = self.name + "_raw_bucket"
+        bucket_name = self.name + "_bucket"
+        groups = collections.defaultdict(
+            lambda: collections.defaultdict(int)
+        )
+        result = []
+        for mv in redis_metric_values:
+            if mv.name == raw_name:
+                labels = copy.copy(mv.labels)
+                le = labels.pop('le')
+                groups[json.dumps(labels, sort_keys=True)][le] += int(mv.value)
+            elif mv.name != bucket_name:
+                result.append(mv)
+
+        for group, counts in groups.items():
+            total = 0
+            for bucket in self._ascending_buckets:
+                total += counts.get(bucket, 0)
+                labels = json.loads(group)
                 labels['le'] = bucket
-                bucket_key = self.get_metric_key(labels, '_bucket')
-                pipe.sadd(group_key, bucket_key)
-                pipe.incr(bucket_key)
-            pipe.sadd(group_key, sum_key, counter_key)
-            pipe.incr(counter_key)
-            pipe.incrbyfloat(sum_key, float(value))
-            await pipe.execute()
+                result.append(MetricValue(
+                    bucket_name,
+                    labels=labels,
+                    value=total
+                ))
+        return result
 
     def _get_missing_metric_values(self, redis_metric_values):
         missing_metrics_values = set(
@@ -380,6 +839,8 @@ class Histogram(Metric):
 
     async def collect(self) -> list:
         redis_metrics = await super().collect()
+        if not self.cumulative:
+            redis_metrics = self._accumulate_buckets(redis_metrics)
         missing_metrics_values, sc_flag = \
             self._get_missing_metric_values(
             redis_metrics
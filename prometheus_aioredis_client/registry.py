@@ -1,31 +1,207 @@
 import asyncio
+import collections
+import math
+import time
+import uuid
+
+from redis.asyncio.cluster import RedisCluster
+
+from .engines import MGetCollectEngine
+from .layouts import KEYS_LAYOUT, migrate
+from .backends import RedisBackend
+from .sharding import HashRing
+from .instrumentation import ClientStats
+from .hooks import HookedBackend
+from .exposition import text_family_lines, openmetrics_family_lines
+
+DEFAULT_COLLECT_CHUNK_SIZE = 1000
+DEFAULT_COLLECT_CONCURRENCY = 10
+DEFAULT_GAUGE_INDEX_LEASE = 60
 
 
 class Registry(object):
 
-    def __init__(self, redis=None, task_manager=None, loop=None):
+    def __init__(self, redis=None, task_manager=None, loop=None,
+                 collect_chunk_size=DEFAULT_COLLECT_CHUNK_SIZE,
+                 collect_engine=None,
+                 layout=KEYS_LAYOUT,
+                 write_buffer=None,
+                 collect_concurrency=DEFAULT_COLLECT_CONCURRENCY,
+                 scrape_cache_ttl: float=None,
+                 gauge_index_lease: int=DEFAULT_GAUGE_INDEX_LEASE,
+                 cluster: bool=None,
+                 backend=None,
+                 self_metrics: bool=False):
         self._metrics = []
         self._refresh_metric_process = None
         self.redis = None
+        self.shards = []
+        self._ring = None
+        self._shard_by_name = {}
         self.task_manager = None
+        self.cluster = cluster
+        self.set_collect_chunk_size(collect_chunk_size)
+        self.collect_engine = collect_engine or MGetCollectEngine()
+        self.layout = layout
+        self._hooks = []
+        self.stats = None
+        self.set_backend(backend or RedisBackend())
+        self.set_self_metrics(self_metrics)
+        self.set_collect_concurrency(collect_concurrency)
+        self.scrape_cache_ttl = scrape_cache_ttl
+        self._output_cache = {}
+        self._output_futures = {}
+        self._output_generation = 0
+        self.gauge_index = None
+        self.gauge_index_lease = gauge_index_lease
+        self._gauge_index_token = None
+        self._gauge_index_future = None
+        self._lease_task_manager = None
+        self.write_buffer = None
+        if write_buffer is not None:
+            self.set_write_buffer(write_buffer)
         self.setup(redis, task_manager, loop)
 
-    async def output(self) -> str:
-        all_metric = []
-        for metric in self._metrics:
-            all_metric.append(metric.doc_string())
-            ms = await metric.collect()
-            all_metric += sorted([
-                p for p in ms
-            ], key=lambda x: x.output())
-        return "\n".join((
-            m.output() for m in all_metric
+    async def collect(self, metrics: list) -> list:
+        """
+        Collect values of metrics concurrently.
+        No more than 'collect_concurrency' metrics collected at same time.
+        Return list of values lists in order of metrics.
+        """
+        semaphore = asyncio.Semaphore(self.collect_concurrency)
+
+        async def collect(metric):
+            async with semaphore:
+                return await self._collect_metric(metric)
+
+        return await asyncio.gather(*(
+            collect(metric) for metric in metrics
         ))
 
+    async def _collect_metric(self, metric) -> list:
+        if self.stats is None:
+            return await metric.collect()
+        start = time.perf_counter()
+        try:
+            return await metric.collect()
+        finally:
+            self.stats.collect_duration.set(
+                time.perf_counter() - start, metric.name
+            )
+
+    def _self_families(self) -> list:
+        if self.stats is None:
+            return []
+        return self.stats.families(self)
+
+    @staticmethod
+    def _family_lines(metric, values: list, openmetrics: bool) -> list:
+        if openmetrics:
+            return openmetrics_family_lines(metric, values)
+        return text_family_lines(metric, values)
+
+    async def output(self, openmetrics: bool=False) -> str:
+        """
+        Return output of all metrics in Prometheus text format
+        or OpenMetrics format.
+        If scrape cache is enabled output is cached for 'scrape_cache_ttl'
+        seconds and concurrent callers wait for one collection.
+        """
+        if self.scrape_cache_ttl is None:
+            return await self._output(openmetrics)
+        output, expire = self._output_cache.get(openmetrics, (None, 0))
+        if output is not None and time.monotonic() < expire:
+            return output
+        if openmetrics not in self._output_futures:
+            self._output_futures[openmetrics] = asyncio.ensure_future(
+                self._cached_output(openmetrics, self._output_generation)
+            )
+        return await asyncio.shield(self._output_futures[openmetrics])
+
+    async def _cached_output(self, openmetrics: bool, generation: int) -> str:
+        try:
+            output = await self._output(openmetrics)
+        finally:
+            if generation == self._output_generation:
+                del self._output_futures[openmetrics]
+        if generation == self._output_generation:
+            self._output_cache[openmetrics] = (
+                output, time.monotonic() + self.scrape_cache_ttl
+            )
+        return output
+
+    def invalidate_output_cache(self):
+        """
+        Drop cached output. Collection which already run
+        will not be cached.
+        """
+        self._output_generation += 1
+        self._output_cache = {}
+        self._output_futures = {}
+
+    async def _output(self, openmetrics: bool=False) -> str:
+        metrics = list(self._metrics)
+        lines = []
+        for metric, values in zip(metrics, await self.collect(metrics)):
+            lines += self._family_lines(metric, values, openmetrics)
+        for family in self._self_families():
+            lines += self._family_lines(family, family.values(), openmetrics)
+        if openmetrics:
+            lines.append("# EOF\n")
+        return "\n".join(lines)
+
+    async def iter_output(self, openmetrics: bool=False):
+        """
+        Yield output encoded in utf-8 by metric families.
+        Next 'collect_concurrency' families collected while current
+        family is sent, so memory is bounded by few families
+        instead of whole registry.
+        If scrape cache is enabled cached output is yielded at once,
+        so concurrent scrapes do not multiply collections.
+        """
+        if self.scrape_cache_ttl is not None:
+            yield (await self.output(openmetrics)).encode('utf-8')
+            return
+        metrics = iter(list(self._metrics))
+        pending = collections.deque()
+
+        def collect_next():
+            for metric in metrics:
+                pending.append(
+                    (metric, asyncio.ensure_future(
+                        self._collect_metric(metric)
+                    ))
+                )
+                return
+
+        for _ in range(self.collect_concurrency):
+            collect_next()
+
+        separator = ""
+        try:
+            while pending:
+                metric, future = pending.popleft()
+                values = await future
+                collect_next()
+                yield (separator + "\n".join(
+                    self._family_lines(metric, values, openmetrics)
+                )).encode('utf-8')
+                separator = "\n"
+            for family in self._self_families():
+                yield (separator + "\n".join(self._family_lines(
+                    family, family.values(), openmetrics
+                ))).encode('utf-8')
+                separator = "\n"
+            if openmetrics:
+                yield (separator + "# EOF\n").encode('utf-8')
+        finally:
+            for _, future in pending:
+                future.cancel()
+
     def setup(self, redis=None, task_manager=None, loop=None):
         self._loop = loop or asyncio.get_event_loop()
-        self.redis = redis
-        self.task_manager = task_manager
+        self.set_redis(redis)
+        self.set_task_manager(task_manager)
         return self
 
     def add_metric(self, *metrics):
@@ -45,13 +221,263 @@ class Registry(object):
             self._metrics.append(m)
 
     def set_redis(self, redis):
-        self.redis = redis
+        """
+        Set redis client or list of clients. With list of clients
+        every metric family stored on one of them chosen by consistent
+        hashing of family name. Gauge indexes stored on first client.
+        Lease of gauge index on previous client is released and new
+        index is claimed on next gauge update.
+        """
+        previous = self.redis
+        if isinstance(redis, (list, tuple)):
+            self.shards = list(redis)
+            self.redis = self.shards[0]
+            self._ring = HashRing(range(len(self.shards)))
+        else:
+            self.shards = [redis] if redis is not None else []
+            self.redis = redis
+            self._ring = None
+        self._shard_by_name = {}
+        if self.gauge_index is not None:
+            self.task_manager.add_task(self.backend.release_gauge_index(
+                self, self.gauge_index, self._gauge_index_token,
+                redis=previous
+            ))
+        self.gauge_index = None
+
+    def get_redis(self, name: str):
+        """
+        Return redis client of metric family.
+        """
+        if self._ring is None:
+            return self.redis
+        if name not in self._shard_by_name:
+            self._shard_by_name[name] = self.shards[self._ring.get_node(name)]
+        return self._shard_by_name[name]
+
+    def set_cluster(self, cluster: bool=None):
+        """
+        Enable or disable Redis Cluster mode. None detect mode
+        by type of redis client. Should be set before first write,
+        because Redis keys of label values are cached.
+        """
+        self.cluster = cluster
+
+    @property
+    def cluster_mode(self) -> bool:
+        if self.cluster is None:
+            return isinstance(self.redis, RedisCluster)
+        return self.cluster
+
+    def pipeline(self, transaction: bool=True, redis=None):
+        """
+        Return pipeline of redis client. Cluster pipeline can not
+        be transactional, so in cluster mode commands are only grouped
+        by nodes. All keys of metric family are in one slot anyway.
+        """
+        return (redis or self.redis).pipeline(
+            transaction=transaction and not self.cluster_mode
+        )
+
+    async def get_gauge_index(self) -> int:
+        """
+        Return index of process shared by all gauges of registry.
+        Index is claimed on first call, call it on startup
+        to claim index before first update.
+        Index with expired lease is reused, otherwise new index
+        is allocated by INCR of global key. Lease is renewed
+        by refresher of task manager and released on close.
+        """
+        if self.gauge_index is not None:
+            return self.gauge_index
+        if self._gauge_index_future is None:
+            self._gauge_index_future = asyncio.ensure_future(
+                self._make_gauge_index()
+            )
+        return await asyncio.shield(self._gauge_index_future)
+
+    async def _make_gauge_index(self) -> int:
+        try:
+            self._check_refresh_period(self.task_manager)
+            await self._claim_gauge_index()
+        finally:
+            self._gauge_index_future = None
+        # values written with previous index, e.g. before set_redis
+        self._move_gauges()
+        if self._lease_task_manager is not self.task_manager:
+            self._lease_task_manager = self.task_manager
+            await self.task_manager.add_refresher(self.renew_gauge_index)
+        return self.gauge_index
+
+    async def _claim_gauge_index(self):
+        token = uuid.uuid4().hex
+        index = await self.backend.claim_gauge_index(
+            self, token, self._lease_time()
+        )
+        self.gauge_index, self._gauge_index_token = index, token
+
+    async def renew_gauge_index(self):
+        """
+        Extend lease of gauge index. If lease was expired and
+        index was claimed by other process, claim other index
+        and move gauge values of process to it.
+        """
+        if self.gauge_index is None:
+            return
+        if await self.backend.renew_gauge_index(
+            self, self.gauge_index,
+            self._gauge_index_token, self._lease_time()
+        ):
+            return
+        await self._claim_gauge_index()
+        self._move_gauges()
+
+    def _lease_time(self) -> int:
+        """
+        Return lease of gauge index in seconds. Index is reused only
+        after values written with it are expired, so lease is not less
+        than longest expire of gauges plus refresh period.
+        """
+        expire = max((
+            metric.expire for metric in self._metrics
+            if hasattr(metric, 'move_to_gauge_index')
+        ), default=0)
+        if expire:
+            expire += self.task_manager.refresh_period
+        return int(math.ceil(max(self.gauge_index_lease, expire)))
+
+    def _move_gauges(self):
+        for metric in self._metrics:
+            if hasattr(metric, 'move_to_gauge_index'):
+                metric.move_to_gauge_index()
 
     def set_task_manager(self, manager):
         self.task_manager = manager
 
+    def _check_refresh_period(self, manager):
+        # lease expires if it is not renewed in time
+        if manager is not None and \
+                manager.refresh_period >= self.gauge_index_lease:
+            raise ValueError(
+                "Refresh period of task manager should be less than "
+                "gauge index lease, got {} and {}".format(
+                    manager.refresh_period, self.gauge_index_lease
+                )
+            )
+
+    def set_collect_chunk_size(self, size: int):
+        """
+        Set max count of keys requested by one MGET while collecting.
+        """
+        if size < 1:
+            raise ValueError("Chunk size should be positive, got {}".format(
+                size
+            ))
+        self.collect_chunk_size = size
+
+    def set_collect_concurrency(self, concurrency: int):
+        """
+        Set max count of metrics collected at same time.
+        """
+        if concurrency < 1:
+            raise ValueError("Concurrency should be positive, got {}".format(
+                concurrency
+            ))
+        self.collect_concurrency = concurrency
+
+    def set_scrape_cache_ttl(self, ttl: float=None):
+        """
+        Cache output for 'ttl' seconds. None disable cache.
+        """
+        self.scrape_cache_ttl = ttl
+        self.invalidate_output_cache()
+
+    def set_collect_engine(self, engine):
+        """
+        Set engine which read metric values from Redis.
+        See prometheus_aioredis_client.engines.
+        """
+        self.collect_engine = engine
+
+    def set_backend(self, backend):
+        """
+        Set storage backend of metric values.
+        See prometheus_aioredis_client.backends.
+        """
+        self._backend = backend
+        self._wrap_backend()
+
+    def _wrap_backend(self):
+        # without hooks backend is called directly
+        if self._hooks:
+            self.backend = HookedBackend(self._backend, list(self._hooks))
+        else:
+            self.backend = self._backend
+
+    def add_hook(self, hook):
+        """
+        Call 'hook.on_command_batch_start(batch)' and
+        'hook.on_command_batch_end(batch)' around every backend operation.
+        See prometheus_aioredis_client.hooks.
+        """
+        self._hooks.append(hook)
+        self._wrap_backend()
+
+    def remove_hook(self, hook):
+        self._hooks.remove(hook)
+        self._wrap_backend()
+
+    def set_self_metrics(self, enabled: bool=True):
+        """
+        Add metrics of client itself to output. Values are kept
+        in process memory. See prometheus_aioredis_client.instrumentation.
+        """
+        if self.stats is not None:
+            self.remove_hook(self.stats)
+        self.stats = ClientStats() if enabled else None
+        if self.stats is not None:
+            self.add_hook(self.stats)
+
+    def set_layout(self, layout):
+        """
+        Set storage layout of metric values.
+        See prometheus_aioredis_client.layouts.
+        """
+        self.layout = layout
+
+    def set_write_buffer(self, write_buffer):
+        """
+        Accumulate increments of counters, summaries and histograms
+        in write buffer and flush them periodically.
+        See prometheus_aioredis_client.buffer.WriteBuffer.
+        """
+        write_buffer.registry = self
+        self.write_buffer = write_buffer
+
+    async def migrate_layout(self, source) -> int:
+        """
+        Move values of all metrics from 'source' layout
+        to current layout of registry.
+        Return count of moved values.
+        """
+        moved = 0
+        for metric in self._metrics:
+            if metric.layout.name == source.name:
+                continue
+            moved += await migrate(self, metric, source, metric.layout)
+        return moved
+
     async def cleanup_and_close(self):
+        # updates added by call_soon may be not in write buffer yet
+        await self.task_manager.wait_tasks()
+        if self.write_buffer is not None:
+            await self.write_buffer.close()
         await self.task_manager.close()
         for metric in self._metrics:
             await metric.cleanup()
         self._metrics = []
+        if self.gauge_index is not None:
+            await self.backend.release_gauge_index(
+                self, self.gauge_index, self._gauge_index_token
+            )
+        self.gauge_index = None
@@ -0,0 +1,39 @@
+"""
+Client-side sharding of metric families.
+
+Every metric family stored on one of Redis instances chosen by
+consistent hashing of family name. Adding instance to the end
+of list moves only part of families to it.
+"""
+import bisect
+import hashlib
+
+DEFAULT_REPLICAS = 100
+
+
+def _hash(value: str) -> int:
+    return int.from_bytes(
+        hashlib.md5(value.encode('utf-8')).digest()[:8], 'big'
+    )
+
+
+class HashRing(object):
+    """
+    Consistent hash ring of nodes. Every node placed on ring
+    'replicas' times to spread names evenly.
+    """
+
+    def __init__(self, nodes: list, replicas: int=DEFAULT_REPLICAS):
+        if not nodes:
+            raise ValueError("Hash ring should contain nodes")
+        points = sorted(
+            (_hash("{}-{}".format(node, replica)), node)
+            for node in nodes
+            for replica in range(replicas)
+        )
+        self._hashes = [point for point, _ in points]
+        self._nodes = [node for _, node in points]
+
+    def get_node(self, name: str):
+        index = bisect.bisect(self._hashes, _hash(name))
+        return self._nodes[index % len(self._nodes)]
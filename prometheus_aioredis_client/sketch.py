@@ -0,0 +1,107 @@
+"""
+Mergeable quantile sketch.
+
+DDSketch count values in bins with logarithmic bounds, so every
+quantile is accurate within relative error of value and sketches
+of processes are merged by adding counts of bins.
+See "DDSketch: A Fast and Fully-Mergeable Quantile Sketch
+with Relative-Error Guarantees" (Masson, Rim, Lee, 2019).
+"""
+import math
+
+DEFAULT_RELATIVE_ACCURACY = 0.01
+DEFAULT_MAX_BINS = 2048
+# values closer to zero are counted in zero bin
+MIN_VALUE = 1e-9
+
+ZERO_BIN = 'z'
+
+
+def _bin_order(name: str) -> tuple:
+    # ascending order of bin values
+    if name == ZERO_BIN:
+        return 1, 0
+    index = int(name[1:])
+    if name[0] == 'n':
+        return 0, -index
+    return 2, index
+
+
+class DDSketch(object):
+    """
+    Counts of values by bins. Bins are named by sign and index:
+    'p<index>' for positive values, 'n<index>' for negative values
+    and 'z' for values near zero, so they can be stored as HASH fields.
+    When count of bins is greater than 'max_bins' lowest bins
+    are collapsed, so memory is bounded and only lowest
+    quantiles lose accuracy. Infinite and NaN values
+    have no bin and are skipped.
+    """
+
+    def __init__(self, relative_accuracy: float=DEFAULT_RELATIVE_ACCURACY,
+                 max_bins: int=DEFAULT_MAX_BINS):
+        if not 0 < relative_accuracy < 1:
+            raise ValueError("Relative accuracy should be in (0, 1), got {}".format(
+                relative_accuracy
+            ))
+        if max_bins < 1:
+            raise ValueError("Max bins should be positive, got {}".format(
+                max_bins
+            ))
+        self.relative_accuracy = relative_accuracy
+        self.max_bins = max_bins
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._log_gamma = math.log(self.gamma)
+        self.bins = {}
+        self.count = 0
+
+    def bin_name(self, value: float) -> str:
+        if -MIN_VALUE < value < MIN_VALUE:
+            return ZERO_BIN
+        index = int(math.ceil(math.log(abs(value)) / self._log_gamma))
+        return ('p' if value > 0 else 'n') + str(index)
+
+    def bin_value(self, name: str) -> float:
+        if name == ZERO_BIN:
+            return 0.0
+        value = 2 * self.gamma ** int(name[1:]) / (self.gamma + 1)
+        return value if name[0] == 'p' else -value
+
+    def add(self, value: float, count: int=1):
+        if not math.isfinite(value):
+            return
+        name = self.bin_name(value)
+        self.bins[name] = self.bins.get(name, 0) + count
+        self.count += count
+        if len(self.bins) > self.max_bins:
+            self._collapse()
+
+    def merge(self, bins: dict):
+        """
+        Add counts of bins of other sketch with the same accuracy.
+        """
+        for name, count in bins.items():
+            self.bins[name] = self.bins.get(name, 0) + count
+            self.count += count
+        if len(self.bins) > self.max_bins:
+            self._collapse()
+
+    def _collapse(self):
+        names = sorted(self.bins, key=_bin_order)
+        extra = len(names) - self.max_bins
+        collapsed = sum(self.bins.pop(name) for name in names[:extra])
+        self.bins[names[extra]] += collapsed
+
+    def quantile(self, q: float) -> float:
+        """
+        Return value of quantile 'q' or None for empty sketch.
+        """
+        if self.count == 0:
+            return None
+        rank = q * (self.count - 1)
+        total = 0
+        for name in sorted(self.bins, key=_bin_order):
+            total += self.bins[name]
+            if total > rank:
+                return self.bin_value(name)
+        return self.bin_value(name)
@@ -1,37 +1,172 @@
 import asyncio
+import collections
 import logging
+import threading
 
 logger = logging.getLogger(__name__)
 
+OVERFLOW_BLOCK = 'block'
+OVERFLOW_DROP_NEWEST = 'drop_newest'
+OVERFLOW_DROP_OLDEST = 'drop_oldest'
+
+OVERFLOW_POLICIES = (
+    OVERFLOW_BLOCK,
+    OVERFLOW_DROP_NEWEST,
+    OVERFLOW_DROP_OLDEST,
+)
+
 
 class TaskManager(object):
     """
     Manage all running tasks and refresh gauge values.
+
+    By default every task run as own asyncio task.
+    If 'queue_size' is set tasks are put in bounded queue
+    and 'workers' coroutines run them by batches of 'batch_size'.
+    When queue is full 'overflow' policy is used:
+    'block' - wait for free place in queue; synchronous 'add_task'
+    can not wait, so at most 'queue_size' tasks wait for place
+    and newer tasks are dropped,
+    'drop_newest' - drop added task,
+    'drop_oldest' - drop oldest task from queue.
+    Count of dropped tasks stored in 'dropped_tasks'.
     """
 
-    def __init__(self, refresh_period=30, refresh_enable=True):
-        self.tasks = []
+    def __init__(self, refresh_period=30, refresh_enable=True,
+                 queue_size: int=None, workers: int=4, batch_size: int=100,
+                 overflow: str=OVERFLOW_BLOCK):
+        if overflow not in OVERFLOW_POLICIES:
+            raise ValueError("Overflow policy should be one of {}, got {}".format(
+                ", ".join(OVERFLOW_POLICIES), overflow
+            ))
+        self.tasks = set()
         self._refresh_enable = refresh_enable
         self._refresh_period = refresh_period
         self._refresh_task = None
         self._refreshers = []
-        self._refresh_lock = asyncio.Lock()
+        self._refresh_lock = None
         self._close = False
 
+        self._queue_size = queue_size
+        self._workers_count = workers
+        self._batch_size = batch_size
+        self._overflow = overflow
+        self._queue = None
+        self._workers = []
+        self._waiting_puts = 0
+        self.dropped_tasks = 0
+
+    @property
+    def pending_tasks(self) -> int:
+        """
+        Count of running tasks and tasks waiting in queue.
+        """
+        queued = self._queue.qsize() if self._queue is not None else 0
+        return len(self.tasks) + queued
+
+    def _get_refresh_lock(self) -> asyncio.Lock:
+        # created in event loop of manager, because before python 3.10
+        # lock is bound to current loop of thread on creation
+        if self._refresh_lock is None:
+            self._refresh_lock = asyncio.Lock()
+        return self._refresh_lock
+
+    @property
+    def refresh_period(self):
+        return self._refresh_period
+
     def set_refresh_period(self, period):
         self._refresh_period = period
 
     def add_task(self, coro):
         if self._close:
+            coro.close()
             raise Exception("Cant add task for closed manager.")
+        if self._queue_size is None:
+            self._run_task(coro)
+        else:
+            self._put_task(coro)
+
+    def _run_task(self, coro):
         task = asyncio.create_task(coro)
-        self.tasks.append(task)
-        task.add_done_callback(self.tasks.remove)
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+
+    def _put_task(self, coro):
+        queue = self._get_queue()
+        try:
+            queue.put_nowait(coro)
+            return
+        except asyncio.QueueFull:
+            pass
+
+        if self._overflow == OVERFLOW_BLOCK and \
+                self._waiting_puts < self._queue_size:
+            self._waiting_puts += 1
+            self._run_task(self._wait_put(queue, coro))
+            return
+
+        self.dropped_tasks += 1
+        if self._overflow == OVERFLOW_DROP_OLDEST:
+            queue.get_nowait().close()
+            queue.task_done()
+            queue.put_nowait(coro)
+        else:
+            coro.close()
+
+    async def _wait_put(self, queue: asyncio.Queue, coro):
+        try:
+            await queue.put(coro)
+        except BaseException:
+            coro.close()
+            raise
+        finally:
+            self._waiting_puts -= 1
+
+    def call_soon(self, callback: callable, *args):
+        """
+        Call function in event loop of manager.
+        """
+        callback(*args)
+
+    async def put_task(self, coro):
+        """
+        Add task and wait for free place in queue.
+        """
+        if self._close:
+            coro.close()
+            raise Exception("Cant add task for closed manager.")
+        if self._queue_size is None:
+            self._run_task(coro)
+        else:
+            await self._get_queue().put(coro)
+
+    def _get_queue(self) -> asyncio.Queue:
+        if self._queue is None:
+            self._queue = asyncio.Queue(maxsize=self._queue_size)
+            self._workers = [
+                asyncio.create_task(self._work())
+                for _ in range(self._workers_count)
+            ]
+        return self._queue
+
+    async def _work(self):
+        queue = self._queue
+        while True:
+            batch = [await queue.get()]
+            while len(batch) < self._batch_size and not queue.empty():
+                batch.append(queue.get_nowait())
+            results = await asyncio.gather(*batch, return_exceptions=True)
+            for result in results:
+                if isinstance(result, Exception):
+                    logger.error("Task failed", exc_info=result)
+            for _ in batch:
+                queue.task_done()
 
     async def add_refresher(self, refresh_async_func: callable):
         if not self._refresh_enable:
             raise Exception('Refresh disable in this manager. Use refresh_enable=True in constructor.')
-        async with self._refresh_lock:
+        async with self._get_refresh_lock():
             if self._close:
                 raise Exception("Cant add refresh function in closed manager.")
             self._refreshers.append(refresh_async_func)
@@ -41,18 +176,129 @@ class TaskManager(object):
     async def refresh(self):
         while self._close is False:
             await asyncio.sleep(self._refresh_period)
-            async with self._refresh_lock:
+            async with self._get_refresh_lock():
                 for refresher in self._refreshers:
-                    await refresher()
+                    # one failed refresher should not stop others,
+                    # lease of gauge index is renewed by refresher too
+                    try:
+                        await refresher()
+                    except Exception:
+                        logger.exception("Refresher %r failed", refresher)
 
     async def wait_tasks(self):
-        if not self.tasks:
-            return
-        await asyncio.wait(self.tasks)
+        if self.tasks:
+            await asyncio.wait(self.tasks)
+        if self._queue is not None:
+            await self._queue.join()
 
     async def close(self):
         self._close = True
         await self.wait_tasks()
-        async with self._refresh_lock:
+        for worker in self._workers:
+            worker.cancel()
+        async with self._get_refresh_lock():
             if self._refresh_task:
                 self._refresh_task.cancel()
+
+
+class ThreadedTaskManager(TaskManager):
+    """
+    Task manager for threaded and WSGI applications.
+
+    Event loop of manager run in background daemon thread.
+    Tasks and calls added from other threads are appended to deque
+    without locks and every 'drain_interval' seconds are started
+    by loop thread in batches, so caller never wait for network.
+    Use 'run' to wait coroutine from other thread and 'stop'
+    to close manager and stop loop thread.
+    """
+
+    def __init__(self, *args, drain_interval: float=0.01, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.drain_interval = drain_interval
+        self._pending = collections.deque()
+        self._drain_task = None
+        self.loop = asyncio.new_event_loop()
+        self._loop_started = threading.Event()
+        self._thread = threading.Thread(
+            target=self._run_loop,
+            name='prometheus-aioredis-client',
+            daemon=True
+        )
+        self._thread.start()
+        self._loop_started.wait()
+
+    def _run_loop(self):
+        asyncio.set_event_loop(self.loop)
+        self._refresh_lock = asyncio.Lock()
+        self._drain_task = self.loop.create_task(self._drain_periodically())
+        self.loop.call_soon(self._loop_started.set)
+        self.loop.run_forever()
+
+    @property
+    def pending_tasks(self) -> int:
+        return len(self._pending) + super().pending_tasks
+
+    def _in_loop_thread(self) -> bool:
+        return threading.get_ident() == self._thread.ident
+
+    def add_task(self, coro):
+        if self._close:
+            coro.close()
+            raise Exception("Cant add task for closed manager.")
+        if self._in_loop_thread():
+            super().add_task(coro)
+        else:
+            self._pending.append(coro)
+
+    def call_soon(self, callback: callable, *args):
+        if self._close:
+            raise Exception("Cant call function in closed manager.")
+        if self._in_loop_thread():
+            callback(*args)
+        else:
+            self._pending.append((callback, args))
+
+    def _drain(self):
+        for _ in range(len(self._pending)):
+            item = self._pending.popleft()
+            if isinstance(item, tuple):
+                callback, args = item
+                try:
+                    callback(*args)
+                except Exception:
+                    logger.exception("Call failed")
+            else:
+                super().add_task(item)
+
+    async def _drain_periodically(self):
+        while True:
+            await asyncio.sleep(self.drain_interval)
+            self._drain()
+
+    def run(self, coro, timeout: float=None):
+        """
+        Run coroutine in loop thread and wait result.
+        """
+        return asyncio.run_coroutine_threadsafe(
+            coro, self.loop
+        ).result(timeout)
+
+    async def wait_tasks(self):
+        self._drain()
+        await super().wait_tasks()
+
+    async def close(self):
+        self._drain()
+        await super().close()
+        self._drain_task.cancel()
+
+    def stop(self):
+        """
+        Close manager and stop loop thread.
+        """
+        if not self._close:
+            self.run(self.close())
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self._thread.join()
+        self.loop.close()
@@ -1,38 +1,76 @@
 
 class Line(object):
 
+    __slots__ = ()
+
     def print(self) -> str:
         pass
 
 
+def escape_label_value(value) -> str:
+    return str(value).replace(
+        '\\', '\\\\'
+    ).replace(
+        '\n', '\\n'
+    ).replace(
+        '"', '\\"'
+    )
+
+
+def format_labels(labels: dict) -> str:
+    """
+    Return labels in exposition format like '{a="1",b="2"}'.
+    """
+    if not labels:
+        return ""
+    return "{" + ",".join([
+        '{key}="{val}"'.format(
+            key=key,
+            val=escape_label_value(labels[key])
+        ) for key in sorted(labels.keys())
+    ]) + "}"
+
+
 class MetricValue(Line):
+    """
+    Value of metric. Labels string can be passed already rendered
+    or it will be rendered from labels on first use.
+    """
+
+    __slots__ = (
+        "name",
+        "labels",
+        "value",
+        "_labels_str",
+    )
 
-    def __init__(self, name, labels, value):
+    def __init__(self, name, labels, value, labels_str: str=None):
         self.name = name
         self.labels = labels
         self.value = value
+        self._labels_str = labels_str
+
+    @property
+    def labels_str(self) -> str:
+        if self._labels_str is None:
+            self._labels_str = format_labels(self.labels)
+        return self._labels_str
+
+    def sort_key(self) -> tuple:
+        return self.name, self.labels_str
 
     def output(self) -> str:
-        if self.labels is None:
-            labels_str = ""
-        else:
-            labels_str = ",".join([
-                '{key}=\"{val}\"'.format(
-                    key=key,
-                    val=self.labels[key]
-                ) for key in sorted(self.labels.keys())
-            ])
-            if labels_str:
-                labels_str = "{" + labels_str + "}"
-        return "%(name)s%(labels)s %(value)s" % dict(
-            name=self.name,
-            labels=labels_str,
-            value=self.value
-        )
+        return self.name + self.labels_str + " " + str(self.value)
 
 
 class DocStringLine(Line):
 
+    __slots__ = (
+        "doc",
+        "name",
+        "type",
+    )
+
     def __init__(self, name, type, documentation):
         self.doc = documentation
         self.name = name
@@ -40,7 +78,7 @@ class DocStringLine(Line):
 
     def output(self):
         return "# HELP {name} {doc}\n# TYPE {name} {type}".format(
-            doc=self.doc,
+            doc=self.doc.replace('\\', '\\\\').replace('\n', '\\n'),
             name=self.name,
             type=self.type,
         )
@@ -0,0 +1,39 @@
+"""
+Handlers for web frameworks. Import aiohttp on module import,
+so use it only if aiohttp is installed.
+"""
+from aiohttp import web
+
+from .exposition import choose_format, gzip_accepted, GzipStream
+from .metrics import REGISTRY
+
+
+def aiohttp_handler(registry=REGISTRY):
+    """
+    Make aiohttp handler which stream output of registry
+    by metric families. Format and gzip compression
+    are chosen by Accept and Accept-Encoding headers.
+    """
+
+    async def handler(request: web.Request) -> web.StreamResponse:
+        openmetrics, content_type = choose_format(
+            request.headers.get('Accept')
+        )
+        headers = {'Content-Type': content_type}
+        gzip_stream = None
+        if gzip_accepted(request.headers.get('Accept-Encoding')):
+            gzip_stream = GzipStream()
+            headers['Content-Encoding'] = 'gzip'
+
+        response = web.StreamResponse(headers=headers)
+        await response.prepare(request)
+        async for chunk in registry.iter_output(openmetrics=openmetrics):
+            if gzip_stream is not None:
+                chunk = await gzip_stream.compress(chunk)
+            await response.write(chunk)
+        if gzip_stream is not None:
+            await response.write(gzip_stream.flush())
+        await response.write_eof()
+        return response
+
+    return handler
@@ -1,5 +1,11 @@
+import asyncio
+
+import pytest
 import prometheus_aioredis_client as prom
 from redis import asyncio as aioredis
+from redis.asyncio.cluster import RedisCluster
+
+REDIS_CLUSTER_URI = 'redis://redis-cluster:6379'
 
 
 class MetricEnvironment(object):
@@ -18,3 +24,27 @@ class MetricEnvironment(object):
     async def __aexit__(self, exc_type, exc_val, exc_tb):
         await prom.REGISTRY.cleanup_and_close()
         await self.redis.close()
+
+
+async def make_cluster_client(redis_uri: str = REDIS_CLUSTER_URI):
+    """
+    Return client of one node Redis Cluster. All slots are assigned
+    to node on first call. Test is skipped if cluster is not available.
+    """
+    redis = aioredis.from_url(redis_uri)
+    try:
+        if not await redis.execute_command('CLUSTER', 'SLOTS'):
+            await redis.execute_command('CLUSTER', 'ADDSLOTSRANGE', 0, 16383)
+        for _ in range(50):
+            info = await redis.cluster('INFO')
+            if info.get('cluster_state') == 'ok':
+                break
+            await asyncio.sleep(0.1)
+        cluster = RedisCluster.from_url(redis_uri)
+        await cluster.initialize()
+    except Exception as e:
+        pytest.skip("Redis Cluster is not available: {!r}".format(e))
+    finally:
+        await redis.close()
+    await cluster.flushall()
+    return cluster
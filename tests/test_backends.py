@@ -0,0 +1,123 @@
+import pytest
+
+import prometheus_aioredis_client as prom
+
+
+def make_registry(backend):
+    return prom.Registry(task_manager=prom.TaskManager(), backend=backend)
+
+
+class TestMemoryBackend(object):
+
+    @pytest.mark.asyncio
+    async def test_metrics_without_redis(self):
+        registry = make_registry(prom.MemoryBackend())
+        counter = prom.Counter(
+            "test_counter", "Counter documentation", ["name"],
+            registry=registry
+        )
+        summary = prom.Summary(
+            "test_summary", "Summary documentation", registry=registry
+        )
+        histogram = prom.Histogram(
+            "test_histogram", "Histogram documentation",
+            buckets=[1, 20], registry=registry
+        )
+        gauge = prom.Gauge(
+            "test_gauge", "Gauge documentation", registry=registry
+        )
+
+        assert (await counter.labels("one").a_inc(2)) == 2
+        counter.labels("one").inc(3)
+        await summary.a_observe(2.5)
+        await histogram.a_observe(3)
+        await gauge.a_inc(4)
+        await gauge.a_dec(1.5)
+        await registry.task_manager.wait_tasks()
+
+        assert (await registry.output()) == (
+            '# HELP test_counter Counter documentation\n'
+            '# TYPE test_counter counter\n'
+            'test_counter{name="one"} 5\n'
+            '# HELP test_summary Summary documentation\n'
+            '# TYPE test_summary summary\n'
+            'test_summary_count 1\n'
+            'test_summary_sum 2.5\n'
+            '# HELP test_histogram Histogram documentation\n'
+            '# TYPE test_histogram histogram\n'
+            'test_histogram_bucket{le="1"} 0\n'
+            'test_histogram_bucket{le="20"} 1\n'
+            'test_histogram_count 1\n'
+            'test_histogram_sum 3\n'
+            '# HELP test_gauge Gauge documentation\n'
+            '# TYPE test_gauge gauge\n'
+            'test_gauge{gauge_index="1"} 2.5'
+        )
+
+        await registry.cleanup_and_close()
+        assert (await registry.backend.read(gauge)) == []
+
+    @pytest.mark.asyncio
+    async def test_write_buffer(self):
+        registry = make_registry(prom.MemoryBackend())
+        registry.set_write_buffer(prom.WriteBuffer(flush_interval=60))
+        counter = prom.Counter(
+            "test_counter", "Counter documentation", registry=registry
+        )
+        for _ in range(10):
+            counter.inc()
+        assert (await registry.output()).endswith("counter")
+        await registry.write_buffer.flush()
+        assert (await registry.output()).endswith("test_counter 10")
+        await registry.cleanup_and_close()
+
+    @pytest.mark.asyncio
+    async def test_gauge_processes(self):
+        backend = prom.MemoryBackend()
+        registries = [make_registry(backend) for _ in range(2)]
+        gauges = [
+            prom.Gauge(
+                "test_gauge", "Gauge documentation",
+                multiprocess_mode='sum', registry=registry
+            )
+            for registry in registries
+        ]
+        await gauges[0].a_set(2)
+        await gauges[1].a_set(3)
+        assert [g.index for g in gauges] == [1, 2]
+        assert (await registries[0].output()).endswith("test_gauge 5")
+
+        await registries[1].cleanup_and_close()
+        assert (await registries[0].output()).endswith("test_gauge 2")
+        # index of closed registry is reused
+        registries[1] = make_registry(backend)
+        assert (await registries[1].get_gauge_index()) == 2
+        for registry in registries:
+            await registry.cleanup_and_close()
+
+    @pytest.mark.asyncio
+    async def test_summary_quantiles(self):
+        backend = prom.MemoryBackend()
+        registries = [make_registry(backend) for _ in range(2)]
+        summaries = [
+            prom.Summary(
+                "test_summary", "Summary documentation",
+                quantiles=[0.5], registry=registry
+            )
+            for registry in registries
+        ]
+        await summaries[0].a_observe(1)
+        await summaries[1].a_observe(100)
+        await summaries[1].a_observe(100)
+        for summary in summaries:
+            await summary.flush_sketches()
+
+        assert (await registries[0].output()) == (
+            '# HELP test_summary Summary documentation\n'
+            '# TYPE test_summary summary\n'
+            'test_summary{quantile="0.5"} 100.49456770856492\n'
+            'test_summary_count 3\n'
+            'test_summary_sum 201'
+        )
+        for registry in registries:
+            await registry.cleanup_and_close()
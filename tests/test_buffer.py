@@ -0,0 +1,144 @@
+import asyncio
+import pytest
+
+from .helpers import MetricEnvironment
+import prometheus_aioredis_client as prom
+
+
+class TestWriteBuffer(object):
+
+    @pytest.mark.asyncio
+    async def test_accumulate_and_flush(self):
+        async with MetricEnvironment() as redis:
+            write_buffer = prom.WriteBuffer(flush_interval=60)
+            prom.REGISTRY.set_write_buffer(write_buffer)
+
+            counter = prom.Counter(
+                name="test_counter",
+                documentation="Counter documentation",
+                labelnames=["name"]
+            )
+            histogram = prom.Histogram(
+                name="test_histogram",
+                documentation="Histogram documentation",
+                buckets=[1, 20]
+            )
+            for _ in range(100):
+                counter.labels("one").inc()
+                counter.labels("two").inc(2)
+                histogram.observe(3)
+
+            assert write_buffer.pending_updates == 300
+            assert (await redis.keys("*")) == []
+
+            await write_buffer.flush()
+            assert write_buffer.pending_updates == 0
+
+            assert (await prom.REGISTRY.output()) == (
+                '# HELP test_counter Counter documentation\n'
+                '# TYPE test_counter counter\n'
+                'test_counter{name="one"} 100\n'
+                'test_counter{name="two"} 200\n'
+                '# HELP test_histogram Histogram documentation\n'
+                '# TYPE test_histogram histogram\n'
+                'test_histogram_bucket{le="1"} 0\n'
+                'test_histogram_bucket{le="20"} 100\n'
+                'test_histogram_count 100\n'
+                'test_histogram_sum 300'
+            )
+
+            counter.labels("one").inc()
+            prom.REGISTRY.write_buffer = None
+            await write_buffer.close()
+            assert int(await redis.get(
+                counter.get_metric_key({"name": "one"})
+            )) == 101
+
+    @pytest.mark.asyncio
+    async def test_flush_by_interval_and_count(self):
+        async with MetricEnvironment() as redis:
+            registry = prom.Registry(
+                redis=redis,
+                task_manager=prom.TaskManager(),
+                write_buffer=prom.WriteBuffer(
+                    flush_interval=0.1, max_pending=3
+                )
+            )
+            counter = prom.Counter(
+                name="test_counter",
+                documentation="Counter documentation",
+                registry=registry
+            )
+            metric_key = counter.get_metric_key({})
+
+            counter.inc()
+            await asyncio.sleep(0.3)
+            assert int(await redis.get(metric_key)) == 1
+
+            for _ in range(3):
+                counter.inc()
+            await registry.task_manager.wait_tasks()
+            assert int(await redis.get(metric_key)) == 4
+
+            counter.inc()
+            await registry.cleanup_and_close()
+            assert int(await redis.get(metric_key)) == 5
+
+    @pytest.mark.asyncio
+    async def test_restore_values_after_failed_flush(self):
+        class FlakyBackend(prom.MemoryBackend):
+            failures = 1
+
+            async def apply_many(self, registry, metric_ops):
+                if self.failures:
+                    self.failures -= 1
+                    raise ConnectionError("backend is down")
+                await super().apply_many(registry, metric_ops)
+
+        write_buffer = prom.WriteBuffer(flush_interval=60)
+        registry = prom.Registry(
+            task_manager=prom.TaskManager(),
+            backend=FlakyBackend(),
+            write_buffer=write_buffer
+        )
+        counter = prom.Counter(
+            "test_counter", "Counter documentation", registry=registry
+        )
+        counter.inc(2)
+        await write_buffer.flush()
+        assert write_buffer.pending_updates == 1
+        counter.inc(3)
+        await write_buffer.flush()
+        assert write_buffer.pending_updates == 0
+
+        assert (await registry.output()) == (
+            '# HELP test_counter Counter documentation\n'
+            '# TYPE test_counter counter\n'
+            'test_counter 5'
+        )
+        await registry.cleanup_and_close()
+
+    @pytest.mark.asyncio
+    async def test_close_during_periodic_flush(self):
+        class SlowBackend(prom.MemoryBackend):
+            async def apply_many(self, registry, metric_ops):
+                await asyncio.sleep(0.05)
+                await super().apply_many(registry, metric_ops)
+
+        backend = SlowBackend()
+        registry = prom.Registry(
+            task_manager=prom.TaskManager(),
+            backend=backend,
+            write_buffer=prom.WriteBuffer(flush_interval=0.01)
+        )
+        counter = prom.Counter(
+            "test_counter", "Counter documentation", registry=registry
+        )
+        counter.inc(5)
+        # periodic flush is inside of apply_many
+        await asyncio.sleep(0.02)
+        await registry.cleanup_and_close()
+
+        assert await backend.read(counter) == [
+            (counter.get_metric_key({}).encode('utf-8'), b'5')
+        ]
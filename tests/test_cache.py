@@ -0,0 +1,108 @@
+import pytest
+
+from .helpers import MetricEnvironment
+import prometheus_aioredis_client as prom
+from prometheus_aioredis_client.cache import LRUCache
+
+
+class TestLRUCache(object):
+
+    def test_drop_least_recently_used(self):
+        cache = LRUCache(2)
+        assert cache.get("a", str.upper, "a") == "A"
+        assert cache.get("b", str.upper, "b") == "B"
+        assert cache.get("a", str.upper, "x") == "A"
+        assert cache.get("c", str.upper, "c") == "C"
+        # 'b' was dropped
+        assert cache.get("b", str.upper, "y") == "Y"
+        assert cache.info() == (1, 4, 2, 2)
+
+    def test_zero_size(self):
+        cache = LRUCache(0)
+        assert cache.get("a", str.upper, "a") == "A"
+        assert cache.get("a", str.upper, "b") == "B"
+        assert cache.info() == (0, 2, 0, 0)
+
+    @pytest.mark.asyncio
+    async def test_metric_keys_cache(self):
+        async with MetricEnvironment() as redis:
+            histogram = prom.Histogram(
+                name="test_histogram",
+                documentation="Histogram documentation",
+                labelnames=["host"],
+                buckets=[1, 2],
+                key_cache_size=1
+            )
+            await histogram.a_observe(1, labels={"host": "one"})
+            await histogram.a_observe(2, labels={"host": "one"})
+            await histogram.a_observe(2, labels={"host": "two"})
+            await histogram.a_observe(2, labels={"host": "one"})
+
+            assert histogram.key_cache_info() == (1, 3, 1, 1)
+            assert float(await redis.get(
+                histogram.get_metric_key({"host": "one", "le": 2}, "_bucket")
+            )) == 3
+
+    @pytest.mark.asyncio
+    async def test_labels_children_cache(self):
+        async with MetricEnvironment() as redis:
+            counter = prom.Counter(
+                name="test_counter",
+                documentation="Counter documentation",
+                labelnames=["host", "url"],
+            )
+            child = counter.labels("one", "/")
+            assert counter.labels("one", "/") is child
+            assert counter.labels(host="one", url="/") is child
+            assert counter.labels("one", url="/") is child
+            assert counter.labels("two", "/") is not child
+            assert child.labels == {"host": "one", "url": "/"}
+            assert not hasattr(child, "__dict__")
+
+            with pytest.raises(ValueError):
+                counter.labels("one")
+            with pytest.raises(ValueError):
+                counter.labels("one", "/", "extra")
+
+            await child.a_inc(2)
+            assert int(await redis.get(
+                counter.get_metric_key({"host": "one", "url": "/"})
+            )) == 2
+
+    @pytest.mark.asyncio
+    async def test_equal_label_values_of_different_types(self):
+        async with MetricEnvironment() as redis:
+            counter = prom.Counter(
+                name="test_counter",
+                documentation="Counter documentation",
+                labelnames=["value"],
+            )
+            await counter.labels(1).a_inc()
+            await counter.labels(True).a_inc()
+            await counter.a_inc(labels={"value": 1.0})
+
+            for value in (1, True, 1.0):
+                assert int(await redis.get(
+                    counter.get_metric_key({"value": value})
+                )) == 1
+
+    @pytest.mark.asyncio
+    async def test_parsed_labels_kept_between_collects(self):
+        async with MetricEnvironment():
+            counter = prom.Counter(
+                name="test_counter",
+                documentation="Counter documentation",
+                labelnames=["name"],
+                key_cache_size=2
+            )
+            for i in range(5):
+                await counter.labels(str(i)).a_inc()
+            first = {mv.labels_str: mv.labels for mv in await counter.collect()}
+            second = {mv.labels_str: mv.labels for mv in await counter.collect()}
+            assert len(first) == 5
+            # labels are parsed once for every series of family
+            assert all(second[key] is first[key] for key in first)
+
+            await prom.REGISTRY.redis.delete(counter.get_metric_key({"name": "0"}))
+            await counter.collect()
+            assert len(counter._labels_cache) == 4
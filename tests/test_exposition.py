@@ -0,0 +1,127 @@
+import gzip
+import pytest
+
+from .helpers import MetricEnvironment
+import prometheus_aioredis_client as prom
+from prometheus_aioredis_client.exposition import (
+    choose_format, gzip_accepted, generate,
+    CONTENT_TYPE_LATEST, CONTENT_TYPE_OPENMETRICS
+)
+
+
+class TestExposition(object):
+
+    def test_choose_format(self):
+        assert choose_format(None) == (False, CONTENT_TYPE_LATEST)
+        assert choose_format("text/plain") == (False, CONTENT_TYPE_LATEST)
+        assert choose_format(
+            "application/openmetrics-text;version=1.0.0,text/plain;q=0.5"
+        ) == (True, CONTENT_TYPE_OPENMETRICS)
+        assert choose_format(
+            "application/openmetrics-text;q=0,text/plain"
+        ) == (False, CONTENT_TYPE_LATEST)
+        assert choose_format(
+            "text/plain;q=1, application/openmetrics-text;q=0.1"
+        ) == (False, CONTENT_TYPE_LATEST)
+        assert choose_format(
+            "text/plain;q=0.5, application/openmetrics-text;q=0.5"
+        ) == (True, CONTENT_TYPE_OPENMETRICS)
+
+    def test_gzip_accepted(self):
+        assert not gzip_accepted(None)
+        assert not gzip_accepted("deflate")
+        assert not gzip_accepted("gzip;q=0")
+        assert gzip_accepted("deflate, gzip;q=0.8")
+
+    @pytest.mark.asyncio
+    async def test_openmetrics_output(self):
+        async with MetricEnvironment() as redis:
+            counter = prom.Counter(
+                name="test_requests_total",
+                documentation="Counter documentation",
+            )
+            histogram = prom.Histogram(
+                name="test_histogram",
+                documentation="Histogram documentation",
+                labelnames=["host"],
+                buckets=[1, 20]
+            )
+            await counter.a_inc(2)
+            await histogram.labels("one").a_observe(3)
+
+            expected = (
+                '# HELP test_requests Counter documentation\n'
+                '# TYPE test_requests counter\n'
+                'test_requests_total 2\n'
+                '# HELP test_histogram Histogram documentation\n'
+                '# TYPE test_histogram histogram\n'
+                'test_histogram_bucket{le="1"} 0\n'
+                'test_histogram_bucket{le="20"} 0\n'
+                'test_histogram_bucket{le="+Inf"} 0\n'
+                'test_histogram_count 0\n'
+                'test_histogram_sum 0\n'
+                'test_histogram_bucket{host="one",le="1"} 0\n'
+                'test_histogram_bucket{host="one",le="20"} 1\n'
+                'test_histogram_bucket{host="one",le="+Inf"} 1\n'
+                'test_histogram_count{host="one"} 1\n'
+                'test_histogram_sum{host="one"} 3\n'
+                '# EOF\n'
+            )
+            assert (await prom.REGISTRY.output(openmetrics=True)) == expected
+            chunks = [
+                chunk async for chunk in
+                prom.REGISTRY.iter_output(openmetrics=True)
+            ]
+            assert b"".join(chunks) == expected.encode('utf-8')
+
+    @pytest.mark.asyncio
+    async def test_openmetrics_user_label_le(self):
+        async with MetricEnvironment():
+            counter = prom.Counter(
+                name="test_requests",
+                documentation="Counter documentation",
+                labelnames=["le"]
+            )
+            await counter.labels("foo").a_inc()
+            await counter.labels("bar").a_inc(2)
+
+            assert (await prom.REGISTRY.output(openmetrics=True)) == (
+                '# HELP test_requests Counter documentation\n'
+                '# TYPE test_requests counter\n'
+                'test_requests_total{le="bar"} 2\n'
+                'test_requests_total{le="foo"} 1\n'
+                '# EOF\n'
+            )
+
+    @pytest.mark.asyncio
+    async def test_generate_gzip(self):
+        async with MetricEnvironment() as redis:
+            counter = prom.Counter(
+                name="test_counter",
+                documentation="Counter documentation",
+            )
+            await counter.a_inc(2)
+
+            body, headers = await generate(
+                prom.REGISTRY,
+                accept="application/openmetrics-text",
+                accept_encoding="gzip"
+            )
+            assert headers == {
+                'Content-Type': CONTENT_TYPE_OPENMETRICS,
+                'Content-Encoding': 'gzip',
+            }
+            assert gzip.decompress(body) == (
+                b'# HELP test_counter Counter documentation\n'
+                b'# TYPE test_counter counter\n'
+                b'test_counter_total 2\n'
+                b'# EOF\n'
+            )
+
+            body, headers = await generate(prom.REGISTRY)
+            assert headers == {'Content-Type': CONTENT_TYPE_LATEST}
+            assert body == (
+                b'# HELP test_counter Counter documentation\n'
+                b'# TYPE test_counter counter\n'
+                b'test_counter 2'
+            )
@@ -176,3 +176,203 @@ class TestGauge(object):
                 "# TYPE test_gauge gauge\n" 
                 "test_gauge{gauge_index=\"%s\"} 12.3"
             ) % gauge_index
+
+    @pytest.mark.asyncio
+    async def test_refresh_values(self):
+        async with MetricEnvironment() as redis:
+            gauge = prom.Gauge(
+                "test_gauge",
+                "Gauge Documentation",
+                ['name'],
+                expire=4,
+            )
+            gauge.REFRESH_CHUNK_SIZE = 2
+
+            for i in range(5):
+                await gauge.labels(name=str(i)).a_set(i)
+            keys = list(gauge.gauge_values.keys())
+            group_key = gauge.get_metric_group_key()
+
+            # expired and removed from group
+            await redis.delete(*keys)
+            await redis.delete(group_key)
+
+            await gauge.refresh_values()
+            for i, key in enumerate(keys):
+                assert float(await redis.get(key)) == i
+                assert 0 < (await redis.ttl(key)) <= 4
+            assert sorted(await redis.smembers(group_key)) == sorted(
+                key.encode('utf-8') for key in keys
+            )
+
+    @pytest.mark.asyncio
+    @pytest.mark.parametrize("mode, expected", [
+        ('sum', '5'),
+        ('max', '3'),
+        ('min', '2'),
+        ('mostrecent', '3'),
+    ])
+    async def test_multiprocess_mode(self, mode, expected):
+        async with MetricEnvironment() as redis:
+            other_manager = prom.TaskManager(refresh_period=2)
+            other_registry = prom.Registry(
+                redis=redis, task_manager=other_manager
+            )
+            gauges = [
+                prom.Gauge(
+                    "test_gauge", "Gauge Documentation", ['name'],
+                    multiprocess_mode=mode, registry=registry,
+                )
+                for registry in (prom.REGISTRY, other_registry)
+            ]
+            await gauges[0].labels(name='a').a_set(2)
+            await gauges[1].labels(name='a').a_inc(3)
+            assert gauges[0].index != gauges[1].index
+
+            assert (await prom.REGISTRY.output()) == (
+                "# HELP test_gauge Gauge Documentation\n"
+                "# TYPE test_gauge gauge\n"
+                "test_gauge{name=\"a\"} %s"
+            ) % expected
+
+            # process is gone, only value of first one is alive
+            await other_registry.cleanup_and_close()
+            assert (await prom.REGISTRY.output()).endswith(
+                "test_gauge{name=\"a\"} 2"
+            )
+
+    @pytest.mark.asyncio
+    async def test_multiprocess_mode_expired_values(self):
+        async with MetricEnvironment() as redis:
+            gauge = prom.Gauge(
+                "test_gauge", "Gauge Documentation",
+                multiprocess_mode='sum', expire=4,
+            )
+            await gauge.a_set(1.5)
+            key = gauge._get_keys({})
+            await redis.hset(key, 'dead', '1.0 100')
+
+            assert (await prom.REGISTRY.output()).endswith(
+                "test_gauge 1.5"
+            )
+            assert await redis.hkeys(key) == [str(gauge.index).encode()]
+
+            await redis.hset(key, gauge.index, '1.0 1')
+            assert (await prom.REGISTRY.output()) == (
+                "# HELP test_gauge Gauge Documentation\n"
+                "# TYPE test_gauge gauge"
+            )
+            assert await redis.smembers(gauge.get_metric_group_key()) == set()
+
+    def test_multiprocess_mode_invalid(self):
+        with pytest.raises(ValueError):
+            prom.Gauge("test_gauge", "Gauge Documentation", multiprocess_mode='avg')
+
+    @pytest.mark.asyncio
+    async def test_concurrent_updates(self):
+        async with MetricEnvironment() as redis:
+            first = prom.Gauge("test_gauge", "Gauge Documentation", ['name'])
+            second = prom.Gauge("test_gauge_2", "Gauge Documentation")
+
+            await asyncio.gather(*(
+                first.labels(name='a').a_inc(1) for _ in range(50)
+            ), second.a_set(3))
+
+            # one index for all gauges of registry
+            assert int(await redis.get(prom.DEFAULT_GAUGE_INDEX_KEY)) == 1
+            assert first.index == second.index == 1
+            key = first._get_keys({'name': 'a'})
+            assert first.gauge_values[key] == 50
+            assert float(await redis.get(key)) == 50
+            # refresher added once per gauge
+            assert prom.REGISTRY.task_manager._refreshers == [
+                prom.REGISTRY.renew_gauge_index,
+                first.refresh_values, second.refresh_values
+            ]
+
+    @pytest.mark.asyncio
+    async def test_gauge_index_reused(self):
+        async with MetricEnvironment() as redis:
+            registries = [
+                prom.Registry(redis=redis, task_manager=prom.TaskManager())
+                for _ in range(3)
+            ]
+            assert await registries[0].get_gauge_index() == 1
+            assert await registries[1].get_gauge_index() == 2
+
+            # released on close
+            await registries[0].cleanup_and_close()
+            assert await registries[2].get_gauge_index() == 1
+            # lease of crashed process is expired
+            await redis.zadd('{GLOBAL_GAUGE_INDEX}_leases', {'2': 1})
+            await registries[2].renew_gauge_index()
+            assert registries[2].gauge_index == 1
+            assert await prom.Registry(
+                redis=redis, task_manager=prom.TaskManager()
+            ).get_gauge_index() == 2
+            assert int(await redis.get(prom.DEFAULT_GAUGE_INDEX_KEY)) == 2
+
+            for registry in registries[1:]:
+                await registry.cleanup_and_close()
+
+    @pytest.mark.asyncio
+    async def test_gauge_index_lease_lost(self):
+        async with MetricEnvironment() as redis:
+            gauge = prom.Gauge("test_gauge", "Gauge Documentation", ['name'])
+            await gauge.labels(name='a').a_set(3)
+            assert gauge.index == 1
+
+            # lease expired and index claimed by other process
+            await redis.zadd('{GLOBAL_GAUGE_INDEX}_leases', {'1': 1})
+            other = prom.Registry(redis=redis, task_manager=prom.TaskManager())
+            assert await other.get_gauge_index() == 1
+
+            await prom.REGISTRY.renew_gauge_index()
+            assert gauge.index == 2
+            await gauge.refresh_values()
+            assert (await prom.REGISTRY.output()).endswith(
+                'test_gauge{gauge_index="2",name="a"} 3.0'
+            )
+            await other.cleanup_and_close()
+
+    @pytest.mark.asyncio
+    async def test_gauge_index_after_set_redis(self):
+        async with MetricEnvironment() as redis:
+            gauge = prom.Gauge("test_gauge", "Gauge Documentation", ['name'])
+            await gauge.labels(name='a').a_set(1)
+            assert gauge.index == 1
+
+            prom.REGISTRY.set_redis(redis)
+            # lease of previous index is released
+            await prom.REGISTRY.task_manager.wait_tasks()
+            assert await redis.zscore('{GLOBAL_GAUGE_INDEX}_leases', '1') == 0
+            other = prom.Registry(redis=redis, task_manager=prom.TaskManager())
+            assert await other.get_gauge_index() == 1
+
+            await gauge.labels(name='b').a_set(2)
+            assert gauge.index == 2
+            await gauge.refresh_values()
+            await redis.delete(
+                gauge.get_metric_key({'name': 'a', 'gauge_index': 1})
+            )
+            assert (await prom.REGISTRY.output()) == (
+                '# HELP test_gauge Gauge Documentation\n'
+                '# TYPE test_gauge gauge\n'
+                'test_gauge{gauge_index="2",name="a"} 1.0\n'
+                'test_gauge{gauge_index="2",name="b"} 2.0'
+            )
+            await other.cleanup_and_close()
+
+    @pytest.mark.asyncio
+    async def test_gauge_index_lease_cover_expire(self):
+        async with MetricEnvironment() as redis:
+            gauge = prom.Gauge("test_gauge", "Gauge Documentation", expire=300)
+            await gauge.a_set(5)
+            now, _ = await redis.time()
+            # index is not reused while values of process are alive
+            lease = await redis.zscore('{GLOBAL_GAUGE_INDEX}_leases', '1')
+            assert lease - now >= 300 + 2
+
+            await prom.REGISTRY.renew_gauge_index()
+            lease = await redis.zscore('{GLOBAL_GAUGE_INDEX}_leases', '1')
+            assert lease - now >= 300 + 2
@@ -175,3 +175,46 @@ class TestHistogram(object):
             assert float(await redis.get(bucket_4_key)) == 2
             assert float(await redis.get(counter_key)) == 2
             assert float(await redis.get(sum_key)) == 5.1
+
+    @pytest.mark.asyncio
+    async def test_not_cumulative_buckets(self):
+        async with MetricEnvironment() as redis:
+
+            histogram = prom.Histogram(
+                name="test_histogram",
+                documentation="Histogram documentation",
+                labelnames=["host"],
+                buckets=[1, 20, 25.5],
+                cumulative=False
+            )
+
+            await histogram.labels(host="one").a_observe(25)
+            await histogram.labels(host="one").a_observe(3)
+            await histogram.labels(host="one").a_observe(20)
+            await histogram.labels(host="one").a_observe(100)
+            group_key = histogram.get_metric_group_key()
+
+            assert sorted(await redis.smembers(group_key)) == [
+                b'test_histogram_count:eyJob3N0IjogIm9uZSJ9',
+                b'test_histogram_raw_bucket:eyJob3N0IjogIm9uZSIsICJsZSI6IDI1LjV9',
+                b'test_histogram_raw_bucket:eyJob3N0IjogIm9uZSIsICJsZSI6IDIwfQ==',
+                b'test_histogram_sum:eyJob3N0IjogIm9uZSJ9',
+            ]
+            assert int(await redis.get(
+                'test_histogram_raw_bucket:eyJob3N0IjogIm9uZSIsICJsZSI6IDIwfQ=='
+            )) == 2
+
+            assert (await prom.REGISTRY.output()) == (
+                '# HELP test_histogram Histogram documentation\n'
+                '# TYPE test_histogram histogram\n'
+                'test_histogram_bucket{host="one",le="1"} 0\n'
+                'test_histogram_bucket{host="one",le="20"} 2\n'
+                'test_histogram_bucket{host="one",le="25.5"} 3\n'
+                'test_histogram_bucket{le="1"} 0\n'
+                'test_histogram_bucket{le="20"} 0\n'
+                'test_histogram_bucket{le="25.5"} 0\n'
+                'test_histogram_count 0\n'
+                'test_histogram_count{host="one"} 4\n'
+                'test_histogram_sum 0\n'
+                'test_histogram_sum{host="one"} 148'
+            )
@@ -0,0 +1,81 @@
+import pytest
+
+from .helpers import MetricEnvironment
+import prometheus_aioredis_client as prom
+
+
+class RecordHook(prom.RegistryHook):
+
+    def __init__(self):
+        self.events = []
+
+    def on_command_batch_start(self, batch):
+        batch.context['span'] = len(self.events)
+        self.events.append(
+            ('start', batch.metric_name, batch.operation, batch.command_count)
+        )
+
+    def on_command_batch_end(self, batch):
+        assert batch.duration >= 0
+        self.events.append((
+            'end', batch.metric_name, batch.operation,
+            batch.context['span'], batch.error is not None
+        ))
+
+
+class FailingBackend(prom.MemoryBackend):
+
+    async def apply(self, metric, ops, expire=None):
+        raise ConnectionError("backend is down")
+
+
+class BrokenHook(prom.RegistryHook):
+
+    def on_command_batch_start(self, batch):
+        raise RuntimeError("broken hook")
+
+
+class TestHooks(object):
+
+    @pytest.mark.asyncio
+    async def test_command_batches(self):
+        async with MetricEnvironment():
+            hook = RecordHook()
+            prom.REGISTRY.add_hook(hook)
+            prom.REGISTRY.add_hook(BrokenHook())
+            histogram = prom.Histogram(
+                "test_histogram", "Histogram documentation", buckets=[1, 20]
+            )
+            await histogram.a_observe(3)
+            await prom.REGISTRY.output()
+
+            assert hook.events == [
+                ('start', 'test_histogram', 'apply', 3),
+                ('end', 'test_histogram', 'apply', 0, False),
+                ('start', 'test_histogram', 'read', 1),
+                ('end', 'test_histogram', 'read', 2, False),
+            ]
+
+            prom.REGISTRY.remove_hook(hook)
+            await histogram.a_observe(3)
+            assert len(hook.events) == 4
+            prom.REGISTRY.remove_hook(prom.REGISTRY._hooks[0])
+            assert prom.REGISTRY.backend is prom.REGISTRY._backend
+
+    @pytest.mark.asyncio
+    async def test_error(self):
+        async with MetricEnvironment():
+            hook = RecordHook()
+            registry = prom.Registry(
+                task_manager=prom.TaskManager(), backend=FailingBackend()
+            )
+            registry.add_hook(hook)
+            counter = prom.Counter(
+                "test_counter", "Counter documentation", registry=registry
+            )
+            with pytest.raises(ConnectionError):
+                await counter.a_inc()
+            assert hook.events[-1] == (
+                'end', 'test_counter', 'apply', 0, True
+            )
+            await registry.cleanup_and_close()
@@ -0,0 +1,88 @@
+import pytest
+
+import prometheus_aioredis_client as prom
+from prometheus_aioredis_client.instrumentation import LocalHistogram
+
+
+class FailingBackend(prom.MemoryBackend):
+
+    async def apply(self, metric, ops, expire=None):
+        raise ConnectionError("Redis is down")
+
+
+class TestSelfMetrics(object):
+
+    def test_local_histogram(self):
+        histogram = LocalHistogram("test", "Documentation", buckets=[1, 10])
+        histogram.observe(0.5)
+        histogram.observe(5)
+        histogram.observe(50)
+        assert [v.output() for v in histogram.values()] == [
+            'prometheus_aioredis_client_test_bucket{le="1"} 1',
+            'prometheus_aioredis_client_test_bucket{le="10"} 2',
+            'prometheus_aioredis_client_test_count 3',
+            'prometheus_aioredis_client_test_sum 55.5',
+        ]
+
+    @pytest.mark.asyncio
+    async def test_output(self):
+        registry = prom.Registry(
+            task_manager=prom.TaskManager(),
+            backend=prom.MemoryBackend(),
+            self_metrics=True
+        )
+        counter = prom.Counter(
+            "test_counter", "Counter documentation", registry=registry
+        )
+        gauge = prom.Gauge(
+            "test_gauge", "Gauge documentation", registry=registry
+        )
+        await counter.a_inc(2)
+        await gauge.a_set(1)
+        await gauge.refresh_values()
+
+        output = await registry.output()
+        assert output.startswith(
+            '# HELP test_counter Counter documentation\n'
+            '# TYPE test_counter counter\n'
+            'test_counter 2\n'
+        )
+        lines = output.split("\n")
+        assert 'prometheus_aioredis_client_pending_tasks 0' in lines
+        assert 'prometheus_aioredis_client_write_batch_size_count 2' in lines
+        assert 'prometheus_aioredis_client_backend_latency_seconds_count' \
+            '{operation="apply"} 2' in lines
+        assert any(line.startswith(
+            'prometheus_aioredis_client_gauge_refresh_duration_seconds'
+            '{family="test_gauge"}'
+        ) for line in lines)
+        assert any(line.startswith(
+            'prometheus_aioredis_client_collect_duration_seconds'
+            '{family="test_counter"}'
+        ) for line in lines)
+
+        streamed = b"".join([chunk async for chunk in registry.iter_output()])
+        assert streamed.decode('utf-8').split("\n")[:3] == lines[:3]
+
+        registry.set_self_metrics(False)
+        assert isinstance(registry.backend, prom.MemoryBackend)
+        assert 'prometheus_aioredis_client' not in (await registry.output())
+        await registry.cleanup_and_close()
+
+    @pytest.mark.asyncio
+    async def test_failures(self):
+        registry = prom.Registry(
+            task_manager=prom.TaskManager(),
+            backend=FailingBackend(),
+            self_metrics=True
+        )
+        counter = prom.Counter(
+            "test_counter", "Counter documentation", registry=registry
+        )
+        with pytest.raises(ConnectionError):
+            await counter.a_inc(2)
+        assert (
+            'prometheus_aioredis_client_backend_failures_total'
+            '{operation="apply"} 1'
+        ) in (await registry.output()).split("\n")
+        await registry.cleanup_and_close()
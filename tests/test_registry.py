@@ -0,0 +1,482 @@
+import asyncio
+import pytest
+
+from .helpers import MetricEnvironment, make_cluster_client
+import prometheus_aioredis_client as prom
+
+
+class TestRegistry(object):
+
+    @pytest.mark.asyncio
+    async def test_collect_in_chunks(self):
+        async with MetricEnvironment() as redis:
+            registry = prom.Registry(
+                redis=redis,
+                task_manager=prom.TaskManager(),
+                collect_chunk_size=2
+            )
+            counter = prom.Counter(
+                name="test_counter",
+                documentation="Counter documentation",
+                labelnames=["name"],
+                registry=registry
+            )
+            for i in range(5):
+                await counter.labels(name=str(i)).a_inc(i + 1)
+
+            assert (await registry.output()) == (
+                "# HELP test_counter Counter documentation\n"
+                "# TYPE test_counter counter\n"
+                "test_counter{name=\"0\"} 1\n"
+                "test_counter{name=\"1\"} 2\n"
+                "test_counter{name=\"2\"} 3\n"
+                "test_counter{name=\"3\"} 4\n"
+                "test_counter{name=\"4\"} 5"
+            )
+            await registry.cleanup_and_close()
+
+    @pytest.mark.asyncio
+    @pytest.mark.parametrize("engine", [
+        prom.MGetCollectEngine(),
+        prom.LuaCollectEngine(),
+    ])
+    async def test_collect_remove_stale_members(self, engine):
+        async with MetricEnvironment() as redis:
+            registry = prom.Registry(
+                redis=redis,
+                task_manager=prom.TaskManager(),
+                collect_chunk_size=2,
+                collect_engine=engine
+            )
+            counter = prom.Counter(
+                name="test_counter",
+                documentation="Counter documentation",
+                labelnames=["name"],
+                registry=registry
+            )
+            for name in ("alive", "dead1", "dead2", "dead3"):
+                await counter.labels(name=name).a_inc()
+            await redis.delete(
+                counter.get_metric_key({"name": "dead1"}),
+                counter.get_metric_key({"name": "dead2"}),
+                counter.get_metric_key({"name": "dead3"}),
+            )
+
+            assert (await registry.output()) == (
+                "# HELP test_counter Counter documentation\n"
+                "# TYPE test_counter counter\n"
+                "test_counter{name=\"alive\"} 1"
+            )
+            assert (await redis.smembers(counter.get_metric_group_key())) == {
+                counter.get_metric_key({"name": "alive"}).encode('utf-8')
+            }
+            await registry.cleanup_and_close()
+
+    @pytest.mark.asyncio
+    async def test_lua_engine_collect_histogram(self):
+        async with MetricEnvironment() as redis:
+            prom.REGISTRY.set_collect_engine(prom.LuaCollectEngine())
+
+            histogram = prom.Histogram(
+                name="test_histogram",
+                documentation="Histogram documentation",
+                buckets=[1, 20]
+            )
+            await histogram.a_observe(3)
+            await histogram.a_observe(5)
+
+            assert (await prom.REGISTRY.output()) == (
+                '# HELP test_histogram Histogram documentation\n'
+                '# TYPE test_histogram histogram\n'
+                'test_histogram_bucket{le="1"} 0\n'
+                'test_histogram_bucket{le="20"} 2\n'
+                'test_histogram_count 2\n'
+                'test_histogram_sum 8'
+            )
+            prom.REGISTRY.set_collect_engine(prom.MGetCollectEngine())
+
+    @pytest.mark.asyncio
+    @pytest.mark.parametrize("concurrency", [1, 3, 100])
+    async def test_collect_concurrently(self, concurrency):
+        async with MetricEnvironment() as redis:
+            registry = prom.Registry(
+                redis=redis,
+                task_manager=prom.TaskManager(),
+                collect_concurrency=concurrency
+            )
+            counters = [
+                prom.Counter(
+                    name="test_counter_{}".format(i),
+                    documentation="Counter documentation",
+                    registry=registry
+                ) for i in (3, 1, 4, 0, 2)
+            ]
+            for counter in counters:
+                await counter.a_inc()
+
+            assert (await registry.output()) == "\n".join(
+                "# HELP test_counter_{i} Counter documentation\n"
+                "# TYPE test_counter_{i} counter\n"
+                "test_counter_{i} 1".format(i=i)
+                for i in (3, 1, 4, 0, 2)
+            )
+            await registry.cleanup_and_close()
+
+    @pytest.mark.asyncio
+    @pytest.mark.parametrize("concurrency", [1, 2, 100])
+    async def test_iter_output(self, concurrency):
+        async with MetricEnvironment() as redis:
+            registry = prom.Registry(
+                redis=redis,
+                task_manager=prom.TaskManager(),
+                collect_concurrency=concurrency
+            )
+            for i in range(5):
+                counter = prom.Counter(
+                    name="test_counter_{}".format(i),
+                    documentation="Counter documentation",
+                    labelnames=["name"],
+                    registry=registry
+                )
+                await counter.labels("one").a_inc(i + 1)
+                await counter.labels("two").a_inc(i + 2)
+
+            chunks = [chunk async for chunk in registry.iter_output()]
+            assert len(chunks) == 5
+            assert chunks[1] == (
+                b'\n# HELP test_counter_1 Counter documentation\n'
+                b'# TYPE test_counter_1 counter\n'
+                b'test_counter_1{name="one"} 2\n'
+                b'test_counter_1{name="two"} 3'
+            )
+            assert b"".join(chunks) == (await registry.output()).encode('utf-8')
+            await registry.cleanup_and_close()
+
+    def test_chunk_size_should_be_positive(self):
+        with pytest.raises(ValueError):
+            prom.Registry().set_collect_chunk_size(0)
+        with pytest.raises(ValueError):
+            prom.Registry(collect_chunk_size=0)
+
+    def test_concurrency_should_be_positive(self):
+        with pytest.raises(ValueError):
+            prom.Registry().set_collect_concurrency(0)
+        with pytest.raises(ValueError):
+            prom.Registry(collect_concurrency=0)
+
+    @pytest.mark.asyncio
+    async def test_refresh_period_less_than_lease(self):
+        # registry without gauges does not need lease
+        registry = prom.Registry(
+            task_manager=prom.TaskManager(refresh_period=90),
+            gauge_index_lease=60,
+            backend=prom.MemoryBackend()
+        )
+        counter = prom.Counter(
+            "test_counter", "Counter documentation", registry=registry
+        )
+        await counter.a_inc()
+        with pytest.raises(ValueError):
+            await registry.get_gauge_index()
+        await registry.cleanup_and_close()
+
+
+class TestHashLayout(object):
+
+    @pytest.mark.asyncio
+    async def test_counter_and_histogram(self):
+        async with MetricEnvironment() as redis:
+            registry = prom.Registry(
+                redis=redis,
+                task_manager=prom.TaskManager(),
+                layout=prom.HASH_LAYOUT
+            )
+            counter = prom.Counter(
+                name="test_counter",
+                documentation="Counter documentation",
+                labelnames=["name"],
+                registry=registry
+            )
+            histogram = prom.Histogram(
+                name="test_histogram",
+                documentation="Histogram documentation",
+                buckets=[1, 20],
+                registry=registry
+            )
+
+            assert (await counter.labels(name="one").a_inc(2)) == 2
+            assert (await counter.labels(name="one").a_inc(3)) == 5
+            await histogram.a_observe(3)
+
+            assert sorted(await redis.keys("*")) == [
+                b"test_counter_hash", b"test_histogram_hash"
+            ]
+            assert (await redis.hgetall("test_counter_hash")) == {
+                counter.get_metric_key({"name": "one"}).encode('utf-8'): b"5"
+            }
+            assert (await registry.output()) == (
+                '# HELP test_counter Counter documentation\n'
+                '# TYPE test_counter counter\n'
+                'test_counter{name="one"} 5\n'
+                '# HELP test_histogram Histogram documentation\n'
+                '# TYPE test_histogram histogram\n'
+                'test_histogram_bucket{le="1"} 0\n'
+                'test_histogram_bucket{le="20"} 1\n'
+                'test_histogram_count 1\n'
+                'test_histogram_sum 3'
+            )
+            await registry.cleanup_and_close()
+
+    @pytest.mark.asyncio
+    async def test_migrate_from_keys_layout(self):
+        async with MetricEnvironment() as redis:
+            counter = prom.Counter(
+                name="test_counter",
+                documentation="Counter documentation",
+            )
+            summary = prom.Summary(
+                name="test_summary",
+                documentation="Summary documentation",
+            )
+            await counter.a_inc(4)
+            await summary.a_observe(2.5)
+
+            prom.REGISTRY.set_layout(prom.HASH_LAYOUT)
+            await counter.a_inc(1)
+            assert (await prom.REGISTRY.migrate_layout(prom.KEYS_LAYOUT)) == 3
+
+            assert sorted(await redis.keys("*")) == [
+                b"test_counter_hash", b"test_summary_hash"
+            ]
+            assert (await prom.REGISTRY.output()) == (
+                '# HELP test_counter Counter documentation\n'
+                '# TYPE test_counter counter\n'
+                'test_counter 5\n'
+                '# HELP test_summary Summary documentation\n'
+                '# TYPE test_summary summary\n'
+                'test_summary_count 1\n'
+                'test_summary_sum 2.5'
+            )
+            assert (await counter.a_inc(1)) == 6
+            prom.REGISTRY.set_layout(prom.KEYS_LAYOUT)
+
+    @pytest.mark.asyncio
+    async def test_migrate_keep_concurrent_increments(self):
+        async with MetricEnvironment() as redis:
+            counter = prom.Counter(
+                name="test_counter",
+                documentation="Counter documentation",
+            )
+            await counter.a_inc(4)
+            key = counter.get_metric_key({})
+
+            class RacingLayout(prom.KeysLayout):
+
+                async def read(self, registry, metric):
+                    pairs = await super().read(registry, metric)
+                    # process which still use keys layout
+                    await redis.incrby(key, 3)
+                    return pairs
+
+            prom.REGISTRY.set_layout(prom.HASH_LAYOUT)
+            assert (await prom.REGISTRY.migrate_layout(RacingLayout())) == 1
+            assert int(await redis.hget("test_counter_hash", key)) == 7
+            assert (await redis.exists(key)) == 0
+            prom.REGISTRY.set_layout(prom.KEYS_LAYOUT)
+
+
+class TestClusterMode(object):
+
+    @pytest.mark.asyncio
+    async def test_hash_tagged_keys(self):
+        async with MetricEnvironment() as redis:
+            registry = prom.Registry(
+                redis=redis,
+                task_manager=prom.TaskManager(),
+                cluster=True
+            )
+            counter = prom.Counter(
+                name="test_counter",
+                documentation="Counter documentation",
+                labelnames=["name"],
+                registry=registry
+            )
+            histogram = prom.Histogram(
+                name="test_histogram",
+                documentation="Histogram documentation",
+                buckets=[1],
+                registry=registry
+            )
+            gauge = prom.Gauge(
+                name="test_gauge",
+                documentation="Gauge documentation",
+                registry=registry
+            )
+
+            await counter.labels(name="one").a_inc(2)
+            await histogram.a_observe(3)
+            await gauge.a_set(4)
+
+            # every key of family has hash tag of family name
+            for key in await redis.keys("*test_*"):
+                assert key.startswith((
+                    b"{test_counter}", b"{test_histogram}", b"{test_gauge}"
+                ))
+            assert (await registry.output()) == (
+                '# HELP test_counter Counter documentation\n'
+                '# TYPE test_counter counter\n'
+                'test_counter{name="one"} 2\n'
+                '# HELP test_histogram Histogram documentation\n'
+                '# TYPE test_histogram histogram\n'
+                'test_histogram_bucket{le="1"} 0\n'
+                'test_histogram_count 1\n'
+                'test_histogram_sum 3\n'
+                '# HELP test_gauge Gauge documentation\n'
+                '# TYPE test_gauge gauge\n'
+                'test_gauge{gauge_index="1"} 4.0'
+            )
+            await registry.cleanup_and_close()
+
+    @pytest.mark.asyncio
+    @pytest.mark.parametrize("engine", [
+        prom.MGetCollectEngine(),
+        prom.LuaCollectEngine(),
+    ])
+    async def test_redis_cluster_client(self, engine):
+        redis = await make_cluster_client()
+        registry = prom.Registry(
+            redis=redis,
+            task_manager=prom.TaskManager(),
+            collect_engine=engine,
+            write_buffer=prom.WriteBuffer(flush_interval=60)
+        )
+        assert registry.cluster_mode is True
+        counter = prom.Counter(
+            name="test_counter",
+            documentation="Counter documentation",
+            labelnames=["name"],
+            registry=registry
+        )
+        histogram = prom.Histogram(
+            name="test_histogram",
+            documentation="Histogram documentation",
+            buckets=[1],
+            registry=registry
+        )
+        gauge = prom.Gauge(
+            name="test_gauge",
+            documentation="Gauge documentation",
+            registry=registry
+        )
+        aggregated = prom.Gauge(
+            name="test_gauge_sum",
+            documentation="Gauge documentation",
+            multiprocess_mode=prom.GAUGE_MODE_SUM,
+            registry=registry
+        )
+
+        # cluster pipelines without transaction
+        await counter.labels(name="one").a_inc(2)
+        counter.labels(name="two").inc(1)
+        await registry.write_buffer.flush()
+        await histogram.a_observe(3)
+        # Lua scripts of gauge index leases and aggregation
+        await gauge.a_set(4)
+        await aggregated.a_set(5)
+
+        assert (await registry.output()) == (
+            '# HELP test_counter Counter documentation\n'
+            '# TYPE test_counter counter\n'
+            'test_counter{name="one"} 2\n'
+            'test_counter{name="two"} 1\n'
+            '# HELP test_histogram Histogram documentation\n'
+            '# TYPE test_histogram histogram\n'
+            'test_histogram_bucket{le="1"} 0\n'
+            'test_histogram_count 1\n'
+            'test_histogram_sum 3\n'
+            '# HELP test_gauge Gauge documentation\n'
+            '# TYPE test_gauge gauge\n'
+            'test_gauge{gauge_index="1"} 4.0\n'
+            '# HELP test_gauge_sum Gauge documentation\n'
+            '# TYPE test_gauge_sum gauge\n'
+            'test_gauge_sum 5'
+        )
+        await registry.cleanup_and_close()
+        await redis.close()
+
+    def test_cluster_mode_detected(self):
+        registry = prom.Registry()
+        assert registry.cluster_mode is False
+        registry.set_cluster(True)
+        assert registry.cluster_mode is True
+
+
+class TestScrapeCache(object):
+
+    @pytest.mark.asyncio
+    async def test_cache_output(self):
+        async with MetricEnvironment() as redis:
+            registry = prom.Registry(
+                redis=redis,
+                task_manager=prom.TaskManager(),
+                scrape_cache_ttl=60
+            )
+            counter = prom.Counter(
+                name="test_counter",
+                documentation="Counter documentation",
+                registry=registry
+            )
+            await counter.a_inc()
+            first_output = await registry.output()
+            assert first_output.endswith("test_counter 1")
+
+            await counter.a_inc()
+            assert (await registry.output()) == first_output
+
+            registry.invalidate_output_cache()
+            assert (await registry.output()).endswith("test_counter 2")
+            await registry.cleanup_and_close()
+
+    @pytest.mark.asyncio
+    async def test_single_flight(self):
+        async with MetricEnvironment() as redis:
+            registry = prom.Registry(
+                redis=redis,
+                task_manager=prom.TaskManager(),
+                scrape_cache_ttl=0
+            )
+            counter = prom.Counter(
+                name="test_counter",
+                documentation="Counter documentation",
+                registry=registry
+            )
+            await counter.a_inc()
+
+            calls = []
+            collect = registry.collect
+
+            async def counted_collect(metrics):
+                calls.append(metrics)
+                return await collect(metrics)
+
+            registry.collect = counted_collect
+            outputs = await asyncio.gather(*(
+                registry.output() for _ in range(5)
+            ))
+            assert len(calls) == 1
+            assert len(set(outputs)) == 1
+
+            async def stream():
+                return b"".join([
+                    chunk async for chunk in registry.iter_output()
+                ])
+
+            streams = await asyncio.gather(*(stream() for _ in range(5)))
+            assert len(calls) == 2
+            assert set(streams) == {outputs[0].encode('utf-8')}
+
+            # ttl is zero, so next output collect values again
+            await counter.a_inc()
+            assert (await registry.output()).endswith("test_counter 2")
+            assert len(calls) == 3
+            await registry.cleanup_and_close()
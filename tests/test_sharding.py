@@ -0,0 +1,69 @@
+import pytest
+from redis import asyncio as aioredis
+
+from .helpers import MetricEnvironment
+import prometheus_aioredis_client as prom
+from prometheus_aioredis_client.sharding import HashRing
+
+
+class TestHashRing(object):
+
+    def test_add_node_moves_part_of_names(self):
+        names = ["metric_{}".format(i) for i in range(1000)]
+        ring = HashRing([0, 1, 2])
+        placement = {name: ring.get_node(name) for name in names}
+        assert set(placement.values()) == {0, 1, 2}
+
+        ring = HashRing([0, 1, 2, 3])
+        moved = [name for name in names if ring.get_node(name) != placement[name]]
+        # only names placed on new node are moved
+        assert all(ring.get_node(name) == 3 for name in moved)
+        assert 150 < len(moved) < 350
+
+    def test_empty(self):
+        with pytest.raises(ValueError):
+            HashRing([])
+
+
+class TestShardedRegistry(object):
+
+    @pytest.mark.asyncio
+    async def test_families_spread_across_shards(self):
+        async with MetricEnvironment() as redis:
+            other_redis = aioredis.from_url('redis://redis:6379', db=1)
+            await other_redis.flushdb()
+            registry = prom.Registry(
+                redis=[redis, other_redis],
+                task_manager=prom.TaskManager(),
+                write_buffer=prom.WriteBuffer(flush_interval=60)
+            )
+            counters = [
+                prom.Counter(
+                    name="test_counter_{}".format(i),
+                    documentation="Counter documentation",
+                    registry=registry
+                )
+                for i in range(10)
+            ]
+            for i, counter in enumerate(counters):
+                counter.inc(i)
+            await registry.write_buffer.flush()
+
+            for i, counter in enumerate(counters):
+                shard = registry.get_redis(counter.name)
+                other = other_redis if shard is redis else redis
+                assert int(await shard.get(counter.get_metric_key({}))) == i
+                assert await other.get(counter.get_metric_key({})) is None
+            assert set(map(registry.get_redis, (c.name for c in counters))) == {
+                redis, other_redis
+            }
+
+            assert (await registry.output()) == "\n".join(
+                '# HELP test_counter_{i} Counter documentation\n'
+                '# TYPE test_counter_{i} counter\n'
+                'test_counter_{i} {i}'.format(i=i)
+                for i in range(10)
+            )
+            await registry.cleanup_and_close()
+            await other_redis.flushdb()
+            await other_redis.close()
@@ -0,0 +1,57 @@
+import random
+
+import pytest
+
+from prometheus_aioredis_client.sketch import DDSketch
+
+
+class TestDDSketch(object):
+
+    def test_relative_accuracy(self):
+        values = [random.lognormvariate(0, 2) for _ in range(10000)]
+        sketch = DDSketch(relative_accuracy=0.01)
+        for value in values:
+            sketch.add(value)
+        values.sort()
+        for q in (0, 0.1, 0.5, 0.9, 0.99, 1):
+            expected = values[int(q * (len(values) - 1))]
+            assert sketch.quantile(q) == pytest.approx(expected, rel=0.01)
+
+    def test_merge(self):
+        first, second, total = DDSketch(), DDSketch(), DDSketch()
+        for value in range(1, 1001):
+            (first if value % 2 else second).add(value)
+            total.add(value)
+        first.merge(second.bins)
+        assert first.bins == total.bins
+        assert first.count == 1000
+
+    def test_zero_and_negative(self):
+        sketch = DDSketch()
+        for value in (-10, -1, 0, 1, 10):
+            sketch.add(value)
+        assert sketch.quantile(0) == pytest.approx(-10, rel=0.01)
+        assert sketch.quantile(0.5) == 0
+        assert sketch.quantile(1) == pytest.approx(10, rel=0.01)
+        assert DDSketch().quantile(0.5) is None
+
+    def test_max_bins(self):
+        sketch = DDSketch(max_bins=10)
+        for value in range(1, 10001):
+            sketch.add(value)
+        assert len(sketch.bins) == 10
+        assert sketch.count == 10000
+        assert sketch.quantile(0.99) == pytest.approx(9900, rel=0.01)
+
+    def test_invalid_arguments(self):
+        with pytest.raises(ValueError):
+            DDSketch(relative_accuracy=1)
+        with pytest.raises(ValueError):
+            DDSketch(max_bins=0)
+
+    def test_skip_not_finite_values(self):
+        sketch = DDSketch()
+        for value in (float('inf'), float('-inf'), float('nan'), 5):
+            sketch.add(value)
+        assert sketch.count == 1
+        assert sketch.quantile(0.5) == pytest.approx(5, rel=0.01)
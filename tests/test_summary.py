@@ -138,3 +138,106 @@ class TestSummary(object):
 
             assert int(await redis.get(metric_count_key)) == 2
             assert float(await redis.get(metric_sum_key)) == 5.4
+
+    @pytest.mark.asyncio
+    async def test_quantiles(self):
+        async with MetricEnvironment() as redis:
+
+            summary = prom.Summary(
+                name="test_summary",
+                documentation="Summary documentation",
+                labelnames=["host"],
+                quantiles=[0.5, 0.99]
+            )
+
+            for value in range(1, 101):
+                await summary.labels(host="a").a_observe(value)
+            # sketch is written by refresher
+            assert await redis.smembers(
+                summary.get_metric_sketch_group_key()
+            ) == set()
+
+            await summary.flush_sketches()
+            for value in range(1, 101):
+                summary.labels(host="a").observe(value)
+            await prom.REGISTRY.task_manager.wait_tasks()
+            await summary.flush_sketches()
+
+            sketch_key = 'test_summary_sketch:eyJob3N0IjogImEifQ=='
+            assert await redis.smembers(
+                summary.get_metric_sketch_group_key()
+            ) == {sketch_key.encode('utf-8')}
+            bins = await redis.hgetall(sketch_key)
+            assert sum(int(count) for count in bins.values()) == 200
+
+            values = {
+                mv.labels.get('quantile'): mv.value
+                for mv in await summary.collect()
+                if mv.name == "test_summary"
+            }
+            assert values[0.5] == pytest.approx(50, rel=0.02)
+            assert values[0.99] == pytest.approx(99, rel=0.02)
+
+            output = await prom.REGISTRY.output()
+            assert 'test_summary{host="a",quantile="0.5"} ' in output
+            assert 'test_summary_count{host="a"} 200' in output
+
+    @pytest.mark.asyncio
+    async def test_quantiles_flushed_on_close(self):
+        async with MetricEnvironment() as redis:
+            summary = prom.Summary(
+                name="test_summary",
+                documentation="Summary documentation",
+                quantiles=[0.5]
+            )
+            await summary.a_observe(2)
+        assert await prom.REGISTRY.backend.read_sketches(summary) == [
+            (b'test_summary_sketch:e30=', {'p35': 1})
+        ]
+
+    @pytest.mark.asyncio
+    async def test_quantiles_of_not_finite_values(self):
+        registry = prom.Registry(
+            task_manager=prom.TaskManager(), backend=prom.MemoryBackend()
+        )
+        summary = prom.Summary(
+            name="test_summary",
+            documentation="Summary documentation",
+            quantiles=[0.5],
+            registry=registry
+        )
+        summary.observe(float('inf'))
+        await summary.a_observe(float('nan'))
+        await summary.a_observe(2)
+        await summary.flush_sketches()
+        assert await registry.backend.read_sketches(summary) == [
+            (b'test_summary_sketch:e30=', {'p35': 1})
+        ]
+        await registry.cleanup_and_close()
+
+    @pytest.mark.asyncio
+    async def test_not_finite_values_skipped(self):
+        async with MetricEnvironment():
+            summary = prom.Summary(
+                name="test_summary",
+                documentation="Summary documentation",
+            )
+            summary.observe(float('inf'))
+            assert (await summary.a_observe(float('-inf'))) is None
+            await summary.a_observe(float('nan'))
+            await summary.a_observe(2)
+            await prom.REGISTRY.task_manager.wait_tasks()
+            assert (await prom.REGISTRY.output()) == (
+                '# HELP test_summary Summary documentation\n'
+                '# TYPE test_summary summary\n'
+                'test_summary_count 1\n'
+                'test_summary_sum 2'
+            )
+
+    def test_invalid_quantiles(self):
+        with pytest.raises(ValueError):
+            prom.Summary("test_summary", "Summary", quantiles=[1.5])
+        with pytest.raises(ValueError):
+            prom.Summary(
+                "test_summary", "Summary", ["quantile"], quantiles=[0.5]
+            )
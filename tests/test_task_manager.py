@@ -0,0 +1,166 @@
+import asyncio
+import threading
+import pytest
+from redis import asyncio as aioredis
+
+from .helpers import MetricEnvironment
+import prometheus_aioredis_client as prom
+
+
+async def append(result: list, value, event: asyncio.Event=None):
+    if event is not None:
+        await event.wait()
+    result.append(value)
+
+
+class TestQueueTaskManager(object):
+
+    @pytest.mark.asyncio
+    async def test_run_tasks_by_workers(self):
+        async with MetricEnvironment() as redis:
+            registry = prom.Registry(
+                redis=redis,
+                task_manager=prom.TaskManager(
+                    queue_size=20, workers=2, batch_size=3
+                )
+            )
+            counter = prom.Counter(
+                name="test_counter",
+                documentation="Counter documentation",
+                registry=registry
+            )
+            for _ in range(30):
+                counter.inc()
+            # tasks wait for place in full queue
+            assert len(registry.task_manager.tasks) == 10
+
+            await registry.task_manager.wait_tasks()
+            assert int(await redis.get(counter.get_metric_key({}))) == 30
+            assert registry.task_manager.dropped_tasks == 0
+            await registry.cleanup_and_close()
+
+    @pytest.mark.asyncio
+    async def test_block_limit_waiting_tasks(self):
+        manager = prom.TaskManager(queue_size=10, workers=1, batch_size=1)
+        result = []
+        for i in range(10000):
+            manager.add_task(append(result, i))
+        assert len(manager.tasks) == 10
+        assert manager.pending_tasks == 20
+        assert manager.dropped_tasks == 9980
+
+        await manager.close()
+        assert result == list(range(20))
+
+    @pytest.mark.asyncio
+    @pytest.mark.parametrize("overflow, expected", [
+        (prom.OVERFLOW_DROP_NEWEST, [0, 1, 2]),
+        (prom.OVERFLOW_DROP_OLDEST, [0, 3, 4]),
+    ])
+    async def test_drop_tasks(self, overflow, expected):
+        manager = prom.TaskManager(
+            queue_size=2, workers=1, batch_size=1, overflow=overflow
+        )
+        event = asyncio.Event()
+        result = []
+        manager.add_task(append(result, 0, event))
+        # worker take first task and wait for event
+        await asyncio.sleep(0)
+        for i in range(1, 5):
+            manager.add_task(append(result, i))
+        assert manager.dropped_tasks == 2
+
+        event.set()
+        await manager.close()
+        assert result == expected
+
+    @pytest.mark.asyncio
+    async def test_refresh_after_failed_refresher(self):
+        manager = prom.TaskManager(refresh_period=0.01)
+        result = []
+
+        async def broken():
+            raise ConnectionError("backend is down")
+
+        async def refresh():
+            result.append(True)
+
+        await manager.add_refresher(broken)
+        await manager.add_refresher(refresh)
+        await asyncio.sleep(0.05)
+        assert len(result) > 1
+        assert not manager._refresh_task.done()
+        await manager.close()
+
+    def test_wrong_overflow_policy(self):
+        with pytest.raises(ValueError):
+            prom.TaskManager(queue_size=2, overflow="wrong")
+
+
+class TestThreadedTaskManager(object):
+
+    def test_sync_updates_from_threads(self):
+        redis = aioredis.from_url('redis://redis:6379')
+        manager = prom.ThreadedTaskManager(refresh_period=2)
+        manager.run(redis.flushdb())
+        registry = prom.Registry(
+            redis=redis,
+            task_manager=manager,
+            write_buffer=prom.WriteBuffer(flush_interval=60)
+        )
+        counter = prom.Counter(
+            name="test_counter",
+            documentation="Counter documentation",
+            labelnames=["name"],
+            registry=registry
+        )
+        gauge = prom.Gauge(
+            name="test_gauge",
+            documentation="Gauge documentation",
+            registry=registry
+        )
+
+        def work():
+            for _ in range(100):
+                counter.labels("one").inc()
+
+        threads = [threading.Thread(target=work) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        gauge.set(3)
+
+        manager.run(manager.wait_tasks())
+        manager.run(registry.write_buffer.flush())
+        assert manager.run(registry.output()) == (
+            '# HELP test_counter Counter documentation\n'
+            '# TYPE test_counter counter\n'
+            'test_counter{name="one"} 400\n'
+            '# HELP test_gauge Gauge documentation\n'
+            '# TYPE test_gauge gauge\n'
+            'test_gauge{gauge_index="1"} 3.0'
+        )
+
+        manager.run(registry.cleanup_and_close())
+        manager.stop()
+        assert not manager._thread.is_alive()
+        with pytest.raises(Exception):
+            counter.labels("one").inc()
+
+    def test_create_in_worker_thread(self):
+        result = []
+
+        async def refresh():
+            result.append(True)
+
+        def work():
+            manager = prom.ThreadedTaskManager(refresh_period=0.01)
+            manager.run(manager.add_refresher(refresh))
+            manager.run(asyncio.sleep(0.05))
+            manager.stop()
+
+        thread = threading.Thread(target=work)
+        thread.start()
+        thread.join()
+        assert len(result) > 0
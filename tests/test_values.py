@@ -0,0 +1,37 @@
+from prometheus_aioredis_client.values import (
+    MetricValue, DocStringLine, format_labels
+)
+
+
+class TestValues(object):
+
+    def test_escape_label_values(self):
+        assert format_labels({
+            "b": 'say "hi"',
+            "a": "back\\slash\nnew line",
+        }) == '{a="back\\\\slash\\nnew line",b="say \\"hi\\""}'
+
+    def test_metric_value_output(self):
+        assert MetricValue("m", None, 1).output() == "m 1"
+        assert MetricValue("m", {}, 1).output() == "m 1"
+        assert MetricValue("m", {"le": 2.5}, "3").output() == 'm{le="2.5"} 3'
+        assert MetricValue(
+            "m", {"le": 2.5}, "3", labels_str='{x="y"}'
+        ).output() == 'm{x="y"} 3'
+
+    def test_sort_key(self):
+        values = [
+            MetricValue("m_sum", {}, 0),
+            MetricValue("m_count", {"a": "2"}, 0),
+            MetricValue("m_count", {"a": "1"}, 0),
+            MetricValue("m_count", {}, 0),
+        ]
+        assert [
+            v.output() for v in sorted(values, key=MetricValue.sort_key)
+        ] == sorted(v.output() for v in values)
+
+    def test_doc_string_output(self):
+        assert DocStringLine("m", "counter", "Two\nlines").output() == (
+            "# HELP m Two\\nlines\n"
+            "# TYPE m counter"
+        )
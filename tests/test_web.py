@@ -0,0 +1,70 @@
+import pytest
+from aiohttp import web
+from aiohttp.test_utils import TestClient, TestServer
+
+from .helpers import MetricEnvironment
+import prometheus_aioredis_client as prom
+from prometheus_aioredis_client.web import aiohttp_handler
+
+
+class TestAiohttpHandler(object):
+
+    @pytest.mark.asyncio
+    async def test_stream_output(self):
+        async with MetricEnvironment() as redis:
+            counter = prom.Counter(
+                name="test_counter",
+                documentation="Counter documentation",
+            )
+            summary = prom.Summary(
+                name="test_summary",
+                documentation="Summary documentation",
+            )
+            await counter.a_inc(2)
+            await summary.a_observe(3)
+
+            app = web.Application()
+            app.router.add_get("/metrics", aiohttp_handler())
+            async with TestClient(TestServer(app)) as client:
+                response = await client.get("/metrics")
+                assert response.status == 200
+                assert response.headers['Content-Type'] == (
+                    'text/plain; version=0.0.4; charset=utf-8'
+                )
+                assert (await response.text()) == (
+                    "# HELP test_counter Counter documentation\n"
+                    "# TYPE test_counter counter\n"
+                    "test_counter 2\n"
+                    "# HELP test_summary Summary documentation\n"
+                    "# TYPE test_summary summary\n"
+                    "test_summary_count 1\n"
+                    "test_summary_sum 3"
+                )
+
+    @pytest.mark.asyncio
+    async def test_openmetrics_gzip_output(self):
+        async with MetricEnvironment() as redis:
+            counter = prom.Counter(
+                name="test_counter",
+                documentation="Counter documentation",
+            )
+            await counter.a_inc(2)
+
+            app = web.Application()
+            app.router.add_get("/metrics", aiohttp_handler())
+            async with TestClient(TestServer(app)) as client:
+                response = await client.get("/metrics", headers={
+                    'Accept': 'application/openmetrics-text; version=1.0.0',
+                    'Accept-Encoding': 'gzip',
+                })
+                assert response.status == 200
+                assert response.headers['Content-Encoding'] == 'gzip'
+                assert response.headers['Content-Type'] == (
+                    'application/openmetrics-text; version=1.0.0; charset=utf-8'
+                )
+                assert (await response.text()) == (
+                    "# HELP test_counter Counter documentation\n"
+                    "# TYPE test_counter counter\n"
+                    "test_counter_total 2\n"
+                    "# EOF\n"
+                )